@@ -43,16 +43,21 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'fertilizer_tracking.assets.PrecompressedStaticMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'fertilizer_tracking.profiling.QueryProfilerMiddleware',
+    'fertilizer_tracking.routers.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'fertilizer_mgmt.urls'
 
+# With no 'loaders' option Django wraps the app directories loader in the
+# cached loader, so compiled templates are reused across requests
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -81,6 +86,78 @@ DATABASES = {
     }
 }
 
+# Reporting views and admin changelists read from this alias when it is in
+# DATABASES. To try it locally, add
+#     'replica': {
+#         'ENGINE': 'django.db.backends.sqlite3',
+#         'NAME': BASE_DIR / 'db_replica.sqlite3',
+#         'TEST': {'MIRROR': 'default'},
+#     }
+# and keep it fresh with "python manage.py refresh_replica --interval 60".
+# Clients read from the primary for REPLICA_STICKY_SECONDS after they write;
+# keep it longer than the refresh interval plus the time a refresh takes.
+DATABASE_ROUTERS = ['fertilizer_tracking.routers.ReplicaRouter']
+REPLICA_DATABASE = 'replica'
+REPLICA_STICKY_SECONDS = 90
+
+# Threads used by the async views to run independent queries concurrently
+ASYNC_QUERY_WORKERS = 4
+
+# Live dashboard updates. InProcessBroker only reaches clients on the same
+# process; with several workers use 'fertilizer_tracking.live.CacheBroker'
+# with a memcached or redis cache (pass its alias in LIVE_UPDATES_BROKER_OPTIONS),
+# since only those allocate event ids atomically across processes. Streams stay open for LIVE_UPDATES_STREAM_SECONDS only under
+# ASGI; under WSGI each response is a long poll of at most
+# LIVE_UPDATES_POLL_SECONDS so it does not tie up a worker.
+LIVE_UPDATES_BROKER = 'fertilizer_tracking.live.InProcessBroker'
+LIVE_UPDATES_BROKER_OPTIONS = {}
+LIVE_UPDATES_STREAM_SECONDS = 300
+LIVE_UPDATES_POLL_SECONDS = 25
+# Threads shared by the open ASGI streams while they wait for events
+LIVE_UPDATES_STREAM_WORKERS = 32
+LIVE_UPDATES_HEARTBEAT_SECONDS = 15
+
+# Fraction of requests whose SQL is profiled, and how many samples each process keeps
+SQL_PROFILER_SAMPLE_RATE = 0.05
+SQL_PROFILER_BUFFER_SIZE = 500
+
+# First month of the farming season used by the seasonal sales rollups
+SALES_SEASON_START_MONTH = 10
+
+# Days of sales used to estimate each depot's velocity when allocating deliveries
+ALLOCATION_VELOCITY_DAYS = 30
+
+# The depot version tokens and dashboard blocks must be seen by every worker
+# process, so the cache lives on disk rather than in each process's memory.
+# Use memcached or redis when workers run on several hosts, or when live
+# updates use CacheBroker, which needs an atomic incr() this backend lacks.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+# Depot pages are cached per depot until that depot's data changes; this caps
+# how long an unchanged depot's summary is kept
+DEPOT_CACHE_SECONDS = 3600
+
+# Depot managers sign in through the admin login page
+LOGIN_URL = 'admin:login'
+
+# Upper bound on how long a cached dashboard block is kept; blocks are also
+# re-rendered as soon as the rows behind them change
+DASHBOARD_CACHE_SECONDS = 300
+
+# Incremental analytics exports re-read this many seconds before their last
+# watermark, to catch rows committed late by long transactions
+EXPORT_OVERLAP_SECONDS = 600
+
+# Where backup_database writes snapshots, and how many to keep
+BACKUP_DIR = BASE_DIR / 'backups'
+BACKUP_KEEP = 14
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -121,6 +198,18 @@ STATIC_URL = 'static/'
 import os
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# collectstatic writes content-hashed names plus .gz/.br copies, which
+# PrecompressedStaticMiddleware serves with far-future cache headers
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'fertilizer_tracking.assets.CompressedManifestStaticFilesStorage',
+    },
+}
+STATIC_MAX_AGE = 60 * 60 * 24 * 365
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -1,16 +1,25 @@
 from django.contrib import admin
-from .models import Depot, Product, Stock, DailySale, UCFPayment, DailyBalance
+from django.db import transaction
+from .models import Depot, Product, Stock, DailySale, UCFPayment, DailyBalance, StockTransfer, ProductPrice
+from .sales import restore_stock_for_sales
 
 @admin.register(Depot)
 class DepotAdmin(admin.ModelAdmin):
-    list_display = ['name', 'district', 'manager', 'phone']
+    list_display = ['name', 'district', 'manager', 'phone', 'capacity']
     search_fields = ['name', 'district', 'manager']
     list_filter = ['district']
+    filter_horizontal = ['users']
+
+class ProductPriceInline(admin.TabularInline):
+    model = ProductPrice
+    extra = 1
+    fields = ['effective_from', 'price_per_bag', 'commission_per_bag']
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = ['name', 'price_per_bag', 'commission_per_bag']
     search_fields = ['name']
+    inlines = [ProductPriceInline]
 
 @admin.register(Stock)
 class StockAdmin(admin.ModelAdmin):
@@ -18,6 +27,13 @@ class StockAdmin(admin.ModelAdmin):
     list_filter = ['depot', 'product']
     search_fields = ['depot__name', 'product__name']
 
+@admin.register(StockTransfer)
+class StockTransferAdmin(admin.ModelAdmin):
+    list_display = ['date', 'product', 'source_depot', 'destination_depot', 'quantity', 'created_at']
+    list_filter = ['date', 'product', 'source_depot', 'destination_depot']
+    readonly_fields = ['date', 'product', 'source_depot', 'destination_depot', 'quantity', 'created_at']
+    date_hierarchy = 'date'
+
 @admin.register(DailySale)
 class DailySaleAdmin(admin.ModelAdmin):
     list_display = ['date', 'depot', 'product', 'bags_sold', 'total_amount', 'commission_earned']
@@ -25,6 +41,12 @@ class DailySaleAdmin(admin.ModelAdmin):
     search_fields = ['depot__name', 'product__name']
     date_hierarchy = 'date'
 
+    def delete_queryset(self, request, queryset):
+        # Bulk deletes skip DailySale.delete(), so restore stock once per depot and product
+        with transaction.atomic():
+            restore_stock_for_sales(queryset)
+            super().delete_queryset(request, queryset)
+
 @admin.register(UCFPayment)
 class UCFPaymentAdmin(admin.ModelAdmin):
     list_display = ['date', 'payment_type', 'amount', 'reference_number', 'description']
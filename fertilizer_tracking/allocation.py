@@ -0,0 +1,193 @@
+"""Splitting an incoming UCF consignment across depots.
+
+A depot's days of cover for a product is its stock divided by its recent
+sales velocity (MT sold per day over the last ALLOCATION_VELOCITY_DAYS
+days). Each product's delivery is poured into the depots with the least
+cover first: every depot that receives stock ends at the same days of
+cover, and that level is found by bisection over all depots at once so the
+allocations add up to the delivery. Depot capacity caps each depot's
+share. Products are allocated scarcest first, so the product with the
+least overall cover claims free space before the others.
+"""
+import math
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+
+from .history import lock_stocks, save_stocks
+from .models import DailySale, Depot, Stock, StockHistory
+
+BAGS_PER_MT = 20
+
+
+class AllocationError(Exception):
+    pass
+
+
+def sales_velocity(days, as_of=None):
+    """MT sold per day for each (depot_id, product_id) over the last days days"""
+    as_of = as_of or date.today()
+    rows = (
+        DailySale.objects.filter(
+            date__gt=as_of - timedelta(days=days), date__lte=as_of,
+            depot__isnull=False, product__isnull=False,
+        )
+        .values('depot_id', 'product_id').annotate(bags=Sum('bags_sold')).order_by()
+    )
+    return {(row['depot_id'], row['product_id']): (row['bags'] or 0) / BAGS_PER_MT / days for row in rows}
+
+
+def _water_fill(velocities, stocks, caps, amount):
+    """Allocate amount across depots so the receiving ones reach equal days of cover.
+
+    velocities, stocks and caps are parallel lists of floats (a cap of
+    math.inf means no limit). Depots with no velocity receive nothing.
+    Returns the allocations; they add up to less than amount only when the
+    selling depots are full.
+    """
+    def allocate(level):
+        return [min(max(level * v - s, 0.0), c) if v > 0 else 0.0 for v, s, c in zip(velocities, stocks, caps)]
+
+    room = sum(c for v, c in zip(velocities, caps) if v > 0)
+    if room <= amount:
+        # Not enough space at the selling depots: fill them all up
+        return allocate(math.inf)
+
+    low, high = 0.0, 1.0
+    while sum(allocate(high)) < amount:
+        high *= 2
+    for _ in range(100):
+        middle = (low + high) / 2
+        if sum(allocate(middle)) < amount:
+            low = middle
+        else:
+            high = middle
+    return allocate(high)
+
+
+def _to_hundredths(allocations, caps, amount):
+    """Round float allocations to whole 0.01 MT without exceeding amount or any cap"""
+    units = int(round(amount * 100))
+    floors = [int(math.floor(a * 100 + 1e-9)) for a in allocations]
+    cap_units = [int(math.floor(c * 100 + 1e-9)) if c < math.inf else None for c in caps]
+    floors = [min(f, c) if c is not None else f for f, c in zip(floors, cap_units)]
+    remaining = min(units, int(round(sum(allocations) * 100))) - sum(floors)
+
+    # Hand the leftover hundredths to the largest fractional remainders
+    order = sorted(range(len(allocations)), key=lambda i: allocations[i] * 100 - floors[i], reverse=True)
+    for i in order:
+        if remaining <= 0:
+            break
+        if allocations[i] > 0 and (cap_units[i] is None or floors[i] < cap_units[i]):
+            floors[i] += 1
+            remaining -= 1
+    return floors
+
+
+def _cover(quantity, velocity):
+    return quantity / velocity if velocity > 0 else None
+
+
+def plan_allocation(incoming, days=None, as_of=None):
+    """Work out how much of each incoming product each depot should receive.
+
+    incoming maps Product to the MT delivered. Returns (lines, unallocated):
+    lines is a list of dicts, one per depot and product receiving stock, and
+    unallocated maps Product to the MT that did not fit anywhere.
+    """
+    days = days or getattr(settings, 'ALLOCATION_VELOCITY_DAYS', 30)
+    depots = list(Depot.objects.order_by('name'))
+    if not depots:
+        raise AllocationError('No depots to allocate to')
+
+    stock = {
+        (depot_id, product_id): float(quantity)
+        for depot_id, product_id, quantity in Stock.objects.filter(depot__isnull=False, product__isnull=False)
+        .values_list('depot_id', 'product_id', 'quantity')
+    }
+    velocity = sales_velocity(days, as_of)
+
+    held = {depot.pk: 0.0 for depot in depots}
+    for (depot_id, _), quantity in stock.items():
+        if depot_id in held:
+            held[depot_id] += quantity
+    free = {
+        depot.pk: max(float(depot.capacity) - held[depot.pk], 0.0) if depot.capacity is not None else math.inf
+        for depot in depots
+    }
+
+    def overall_cover(product):
+        total_velocity = sum(velocity.get((depot.pk, product.pk), 0.0) for depot in depots)
+        total_stock = sum(stock.get((depot.pk, product.pk), 0.0) for depot in depots)
+        return total_stock / total_velocity if total_velocity > 0 else math.inf
+
+    lines = []
+    unallocated = {}
+    for product in sorted(incoming, key=overall_cover):
+        amount = float(incoming[product])
+        velocities = [velocity.get((depot.pk, product.pk), 0.0) for depot in depots]
+        stocks = [stock.get((depot.pk, product.pk), 0.0) for depot in depots]
+        caps = [free[depot.pk] for depot in depots]
+
+        allocations = _water_fill(velocities, stocks, caps, amount)
+        leftover = amount - sum(allocations)
+        if leftover > 0.005:
+            # Depots without recent sales of the product take the rest, evening out their stock
+            idle = [1.0 if v == 0 else 0.0 for v in velocities]
+            extra = _water_fill(idle, stocks, [c - a for c, a in zip(caps, allocations)], leftover)
+            allocations = [a + e for a, e in zip(allocations, extra)]
+
+        units = _to_hundredths(allocations, caps, amount)
+        given = (Decimal(sum(units)) / 100).quantize(Decimal('0.01'))
+        if given < incoming[product]:
+            unallocated[product] = incoming[product] - given
+
+        for depot, depot_units, v, s in zip(depots, units, velocities, stocks):
+            if not depot_units:
+                continue
+            quantity = (Decimal(depot_units) / 100).quantize(Decimal('0.01'))
+            free[depot.pk] -= float(quantity)
+            lines.append({
+                'depot': depot,
+                'product': product,
+                'current': Decimal(str(s)).quantize(Decimal('0.01')),
+                'velocity': v,
+                'quantity': quantity,
+                'cover_before': _cover(s, v),
+                'cover_after': _cover(s + float(quantity), v),
+            })
+
+    return lines, unallocated
+
+
+def apply_allocation(lines, delivery_date, reference=''):
+    """Add an accepted allocation to stock in one transaction.
+
+    Stock rows are locked in id order, updated with a single bulk update and
+    given one 'addition' history entry each.
+    """
+    pairs = {(line['depot'].pk, line['product'].pk) for line in lines}
+
+    with transaction.atomic():
+        # Depots receiving a product for the first time start from zero
+        stocks = lock_stocks(pairs)
+
+        history = []
+        for line in lines:
+            stock = stocks[(line['depot'].pk, line['product'].pk)]
+            previous_quantity = stock.quantity
+            stock.quantity += line['quantity']
+            history.append(StockHistory(
+                stock=stock,
+                date=delivery_date,
+                previous_quantity=previous_quantity,
+                new_quantity=stock.quantity,
+                change_type='addition',
+                description=f"UCF delivery allocation of {line['quantity']} MT {line['product'].name}"
+                + (f" ({reference})" if reference else ''),
+            ))
+
+        return save_stocks(stocks.values(), history)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FertilizerTrackingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'fertilizer_tracking'
+
+    def ready(self):
+        from . import signals  # noqa: F401
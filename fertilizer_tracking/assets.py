@@ -0,0 +1,107 @@
+"""Hashed, precompressed static files.
+
+CompressedManifestStaticFilesStorage extends Django's manifest storage so
+that collectstatic also writes a .gz copy (and a .br copy when the brotli
+package is installed) of every compressible file. PrecompressedStaticMiddleware
+serves STATIC_ROOT when Django itself serves static files, picking the
+smallest encoding the client accepts. Files whose names carry a content hash
+never change, so they get a one-year immutable cache lifetime.
+"""
+import functools
+import gzip
+import mimetypes
+import os
+import posixpath
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.json', '.map', '.svg', '.txt', '.html', '.xml', '.ico', '.ttf', '.otf', '.eot'}
+MIN_COMPRESS_SIZE = 512
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def compress_file(path):
+    """Write .gz (and .br when available) siblings of path, keeping only those that are smaller"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return []
+
+    outputs = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        outputs.append(('.br', brotli.compress(data, quality=11)))
+
+    written = []
+    for suffix, compressed in outputs:
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            written.append(path + suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        # Compress both the original and the hashed names, once hashing has finished
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS and self.exists(name):
+                compress_file(self.path(name))
+
+
+@functools.lru_cache(maxsize=None)
+def hashed_names():
+    """Content-hashed file names from the staticfiles manifest, read once per process"""
+    return frozenset(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+
+class PrecompressedStaticMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL if settings.STATIC_URL.startswith('/') else '/' + settings.STATIC_URL
+        self.root = settings.STATIC_ROOT
+        self.max_age = getattr(settings, 'STATIC_MAX_AGE', 60 * 60 * 24 * 365)
+
+    def __call__(self, request):
+        if self.root and request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix):
+            return self.serve(request, request.path[len(self.prefix):])
+        return self.get_response(request)
+
+    def serve(self, request, name):
+        name = posixpath.normpath(name).lstrip('/')
+        try:
+            path = safe_join(self.root, name)
+        except (ValueError, SuspiciousFileOperation):
+            raise Http404('Invalid static path')
+        if not os.path.isfile(path):
+            raise Http404(f"'{name}' could not be found")
+
+        content_type, _ = mimetypes.guess_type(path)
+        accepted = request.headers.get('Accept-Encoding', '')
+        encoding = None
+        for candidate, suffix in ENCODINGS:
+            if candidate in accepted and os.path.isfile(path + suffix):
+                encoding, path = candidate, path + suffix
+                break
+
+        response = FileResponse(open(path, 'rb'), content_type=content_type or 'application/octet-stream')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        if name in hashed_names():
+            response.headers['Cache-Control'] = f'public, max-age={self.max_age}, immutable'
+        else:
+            # Unhashed names may change on the next deploy, so let clients revalidate them
+            response.headers['Cache-Control'] = 'public, max-age=60'
+        return response
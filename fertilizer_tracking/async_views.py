@@ -0,0 +1,62 @@
+"""Async versions of the heavier read-only views, for deployments served over ASGI.
+
+The dashboard and UCF balance report are made of independent queries, so
+instead of running them one after another each one is sent to a small,
+bounded thread pool and they are awaited together. The pool size caps how
+many extra database connections these views can open.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.shortcuts import render
+
+from . import views
+from .profiling import record_queries
+
+query_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'ASYNC_QUERY_WORKERS', 4),
+    thread_name_prefix='async-query',
+)
+
+
+def _in_worker(func, *args):
+    # Pool threads keep their own connections, so honour CONN_MAX_AGE around each query
+    close_old_connections()
+    try:
+        with record_queries():
+            return func(*args)
+    finally:
+        close_old_connections()
+
+
+async def run_query(func, *args):
+    """Run a blocking query function on the query pool"""
+    return await sync_to_async(_in_worker, thread_sensitive=False, executor=query_executor)(func, *args)
+
+
+async def dashboard(request):
+    sales_totals, stock_summary, recent_payments, recent_stock_changes, cache_versions = await asyncio.gather(
+        run_query(views.get_sales_totals),
+        run_query(views.get_stock_summary),
+        run_query(views.get_recent_payments),
+        run_query(views.get_recent_stock_changes),
+        run_query(views.get_dashboard_cache_versions),
+    )
+    context = views.build_dashboard_context(
+        sales_totals, stock_summary, recent_payments, recent_stock_changes, cache_versions
+    )
+
+    return await sync_to_async(render)(request, 'fertilizer_tracking/dashboard.html', context)
+
+
+async def ucf_balance_report(request):
+    ucf_totals, payments = await asyncio.gather(
+        run_query(views.get_ucf_totals),
+        run_query(views.get_all_payments),
+    )
+    context = views.build_ucf_balance_context(ucf_totals, payments)
+
+    return await sync_to_async(render)(request, 'fertilizer_tracking/ucf_balance.html', context)
@@ -0,0 +1,159 @@
+"""Depot-scoped dashboard and report data, cached per depot.
+
+Every depot has a version token in the cache, and its cached summaries are
+keyed on that token. Saving or deleting one of the depot's Stock, DailySale
+or StockHistory rows replaces the token once the transaction commits, so a
+change at one depot never throws away another depot's cached pages. Bulk
+writes that skip model signals call invalidate_depots() themselves.
+
+The tokens only work across worker processes when the default cache is
+shared by them (see CACHES in settings); a per-process local-memory cache
+would let one worker keep serving a depot page another worker invalidated.
+"""
+import uuid
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from .models import DailySale, Depot, Stock, StockHistory
+
+
+def _version_key(depot_id):
+    return f'depot:{depot_id}:version'
+
+
+def depot_version(depot_id):
+    version = cache.get(_version_key(depot_id))
+    if version is None:
+        cache.add(_version_key(depot_id), uuid.uuid4().hex, timeout=None)
+        version = cache.get(_version_key(depot_id))
+    return version
+
+
+def invalidate_depots(depot_ids):
+    """Drop the cached summaries of the given depots once the current transaction commits"""
+    depot_ids = {depot_id for depot_id in depot_ids if depot_id}
+    if not depot_ids:
+        return
+
+    def bump():
+        cache.set_many({_version_key(depot_id): uuid.uuid4().hex for depot_id in depot_ids}, timeout=None)
+    transaction.on_commit(bump, robust=True)
+
+
+def invalidate_all_depots():
+    invalidate_depots(Depot.objects.values_list('id', flat=True))
+
+
+def user_depots(user):
+    """Depots a user may view: staff see every depot, other users only their own"""
+    if user.is_staff:
+        return Depot.objects.order_by('name')
+    return user.depots.order_by('name')
+
+
+def _cached(depot, name, build, *args):
+    key = f'depot:{depot.pk}:{name}:{depot_version(depot.pk)}:{date.today()}:' + ':'.join(str(arg) for arg in args)
+    value = cache.get(key)
+    if value is None:
+        value = build(depot, *args)
+        cache.set(key, value, timeout=getattr(settings, 'DEPOT_CACHE_SECONDS', 3600))
+    return value
+
+
+def build_depot_summary(depot):
+    today = date.today()
+    stocks = []
+    total_value = 0
+    total_bags = 0
+    for stock in Stock.objects.filter(depot=depot).select_related('product').prefetch_related('product__prices'):
+        value = stock.get_monetary_value()
+        bags = stock.get_available_bags()
+        total_value += value
+        total_bags += bags
+        stocks.append({
+            'id': stock.pk,
+            'product': stock.product.name if stock.product else '',
+            'quantity': stock.quantity,
+            'available_bags': bags,
+            'monetary_value': value,
+        })
+
+    month_start = today.replace(day=1)
+    sales_totals = DailySale.objects.filter(depot=depot).aggregate(
+        total_sales=Sum('total_amount'),
+        total_commissions=Sum('commission_earned'),
+        total_bags=Sum('bags_sold'),
+        month_sales=Sum('total_amount', filter=Q(date__gte=month_start)),
+        month_bags=Sum('bags_sold', filter=Q(date__gte=month_start)),
+        sale_days=Count('date', distinct=True),
+    )
+
+    recent_sales = [
+        {
+            'date': sale.date,
+            'product': sale.product.name if sale.product else '',
+            'bags_sold': sale.bags_sold,
+            'total_amount': sale.total_amount,
+            'commission_earned': sale.commission_earned,
+        }
+        for sale in DailySale.objects.filter(depot=depot).select_related('product').order_by('-date')[:10]
+    ]
+
+    recent_changes = [
+        {
+            'date': change.date,
+            'product': change.stock.product.name if change.stock.product else '',
+            'quantity_change': change.quantity_change,
+            'change_type': change.change_type,
+            'change_type_display': change.get_change_type_display(),
+        }
+        for change in StockHistory.objects.filter(stock__depot=depot)
+        .select_related('stock__product').order_by('-date', '-created_at')[:10]
+    ]
+
+    return {
+        'stocks': stocks,
+        'total_stock_value': total_value,
+        'total_available_bags': total_bags,
+        'sales_totals': {key: value or 0 for key, value in sales_totals.items()},
+        'recent_sales': recent_sales,
+        'recent_stock_changes': recent_changes,
+    }
+
+
+def get_depot_summary(depot):
+    return _cached(depot, 'summary', build_depot_summary)
+
+
+def build_depot_sales(depot, start_date, end_date):
+    sales = DailySale.objects.filter(depot=depot, date__range=[start_date, end_date])
+    by_product = list(
+        sales.values('product__name').annotate(
+            bags=Sum('bags_sold'), amount=Sum('total_amount'), commission=Sum('commission_earned')
+        ).order_by('product__name')
+    )
+    rows = [
+        {
+            'date': sale.date,
+            'product': sale.product.name if sale.product else '',
+            'bags_sold': sale.bags_sold,
+            'total_amount': sale.total_amount,
+            'commission_earned': sale.commission_earned,
+        }
+        for sale in sales.select_related('product').order_by('-date', 'product__name')
+    ]
+    return {
+        'sales': rows,
+        'by_product': by_product,
+        'total_sales': sum(row['amount'] or 0 for row in by_product),
+        'total_commissions': sum(row['commission'] or 0 for row in by_product),
+        'total_bags': sum(row['bags'] or 0 for row in by_product),
+    }
+
+
+def get_depot_sales(depot, start_date, end_date):
+    return _cached(depot, 'sales', build_depot_sales, start_date, end_date)
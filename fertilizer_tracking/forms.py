@@ -1,6 +1,7 @@
 from django import forms
 from django.core.exceptions import ValidationError
 from .models import DailySale, UCFPayment, Stock, StockHistory
+from .transfers import TransferError, parse_transfer_lines
 from datetime import date
 
 class DailySaleForm(forms.ModelForm):
@@ -53,7 +54,8 @@ class UCFPaymentForm(forms.ModelForm):
 
 class StockUpdateForm(forms.ModelForm):
     change_type = forms.ChoiceField(
-        choices=StockHistory.CHANGE_TYPES,
+        # Transfers are recorded through the transfer page so both depots stay in step
+        choices=[choice for choice in StockHistory.CHANGE_TYPES if not choice[0].startswith('transfer')],
         initial='addition',
         widget=forms.Select(attrs={'class': 'form-control'})
     )
@@ -72,4 +74,35 @@ class StockUpdateForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if self.instance and self.instance.pk:
-            self.fields['quantity'].initial = self.instance.quantity
\ No newline at end of file
+            self.fields['quantity'].initial = self.instance.quantity
+
+class StatementUploadForm(forms.Form):
+    statement = forms.FileField(
+        help_text='CSV with date, reference and amount (or debit and credit) columns',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv'})
+    )
+    tolerance_days = forms.IntegerField(
+        initial=3,
+        min_value=0,
+        max_value=31,
+        widget=forms.NumberInput(attrs={'class': 'form-control'})
+    )
+
+class StockTransferForm(forms.Form):
+    date = forms.DateField(
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    lines = forms.CharField(
+        help_text='One transfer per line: source depot, destination depot, product, quantity (MT), optional note',
+        widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 8, 'placeholder': 'MONZE, PEMBA, UREA, 5.5, Top up for planting'})
+    )
+    notes = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 3, 'placeholder': 'Optional notes for the whole transfer'})
+    )
+    
+    def clean_lines(self):
+        try:
+            return parse_transfer_lines(self.cleaned_data['lines'])
+        except TransferError as e:
+            raise ValidationError(str(e).split('\n'))
@@ -0,0 +1,56 @@
+from django.utils import timezone
+
+from . import live
+from .depots import invalidate_depots
+from .models import Stock, StockHistory
+from .search import index_objects
+from .signals import publish_on_commit
+
+
+def bulk_create_history(records, batch_size=1000):
+    """Insert StockHistory rows in bulk.
+
+    bulk_create() skips StockHistory.save() and the post_save signal, so the
+    quantity change, the search index entries and the depot cache
+    invalidation are handled here instead.
+    """
+    for record in records:
+        record.quantity_change = record.new_quantity - record.previous_quantity
+    created = StockHistory.objects.bulk_create(records, batch_size=batch_size)
+    index_objects('stock_history', created)
+    invalidate_depots({record.stock.depot_id for record in created})
+    return created
+
+
+def lock_stocks(pairs):
+    """Lock the stock records for a set of (depot_id, product_id) pairs.
+
+    Must run inside a transaction. Missing records are created at zero, and
+    rows are locked in id order so concurrent batches can't deadlock.
+    Returns a dict mapping each pair to its Stock.
+    """
+    for depot_id, product_id in pairs:
+        Stock.objects.get_or_create(depot_id=depot_id, product_id=product_id, defaults={'quantity': 0})
+
+    locked = Stock.objects.select_for_update().filter(
+        depot_id__in={d for d, _ in pairs}, product_id__in={p for _, p in pairs}
+    ).order_by('id')
+    return {
+        (stock.depot_id, stock.product_id): stock
+        for stock in locked
+        if (stock.depot_id, stock.product_id) in pairs
+    }
+
+
+def save_stocks(stocks, history):
+    """Write back stock records locked by lock_stocks() and insert their history, returning the history"""
+    now = timezone.now()
+    for stock in stocks:
+        stock.date_updated = now
+    Stock.objects.bulk_update(stocks, ['quantity', 'date_updated'])
+    created = bulk_create_history(history)
+
+    # bulk_update skips post_save, so push the dashboard updates here
+    for stock in stocks:
+        publish_on_commit('stock', live.stock_event, stock)
+    return created
@@ -0,0 +1,166 @@
+"""Consistency checks between Stock, StockHistory and DailySale.
+
+For every stock record (one per depot and product) the verifier checks that:
+
+* each history entry starts where the previous one ended,
+* the last history entry ends at the current Stock.quantity, and
+* the bags on 'sale' history entries add up to DailySale.bags_sold per day.
+
+History before the most recent 'correction' entry is treated as already
+reconciled, which is what the repair mode relies on: it appends one
+correction entry per broken stock record that brings the chain up to the
+current quantity.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from django.db import connections, transaction
+from django.db.models import Sum
+
+from .history import bulk_create_history
+from .models import DailySale, Stock, StockHistory
+
+
+def _init_worker():
+    # Workers started with 'spawn' need Django set up; forked workers already have it
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+def verify_partition(stock_ids):
+    """Verify a group of stock records, returning a list of discrepancy dicts"""
+    stocks = {
+        stock_id: (depot_id, product_id, quantity)
+        for stock_id, depot_id, product_id, quantity in Stock.objects.filter(id__in=stock_ids)
+        .values_list('id', 'depot_id', 'product_id', 'quantity')
+    }
+    discrepancies = []
+
+    # Walk each history chain in insertion order, streaming rows rather than loading them all
+    history = (
+        StockHistory.objects.filter(stock_id__in=stock_ids)
+        .order_by('stock_id', 'id')
+        .values_list('stock_id', 'id', 'date', 'previous_quantity', 'new_quantity', 'change_type')
+        .iterator(chunk_size=2000)
+    )
+    chain_ends = {}
+    pending_gaps = {}
+    for stock_id, history_id, history_date, previous_quantity, new_quantity, change_type in history:
+        if change_type == 'correction':
+            pending_gaps[stock_id] = []
+        last = chain_ends.get(stock_id)
+        if last is not None and last[1] != previous_quantity and change_type != 'correction':
+            pending_gaps.setdefault(stock_id, []).append({
+                'stock_id': stock_id,
+                'check': 'chain_gap',
+                'history_id': history_id,
+                'date': history_date,
+                'expected': last[1],
+                'found': previous_quantity,
+            })
+        chain_ends[stock_id] = (history_id, new_quantity)
+
+    for stock_id, gaps in pending_gaps.items():
+        discrepancies.extend(gaps)
+
+    for stock_id, (depot_id, product_id, quantity) in stocks.items():
+        last = chain_ends.get(stock_id)
+        if last is not None and last[1] != quantity:
+            discrepancies.append({
+                'stock_id': stock_id,
+                'check': 'chain_end',
+                'history_id': last[0],
+                'date': None,
+                'expected': quantity,
+                'found': last[1],
+            })
+
+    # Compare bags per day on sale history entries with the recorded sales
+    history_bags = {
+        (row['stock_id'], row['date']): row['bags'] or 0
+        for row in StockHistory.objects.filter(stock_id__in=stock_ids, change_type='sale')
+        .values('stock_id', 'date').annotate(bags=Sum('bags_sold')).order_by()
+    }
+    stock_by_pair = {(depot_id, product_id): stock_id for stock_id, (depot_id, product_id, _) in stocks.items()}
+    sale_bags = {}
+    sales = (
+        DailySale.objects.filter(depot_id__in={d for d, _ in stock_by_pair}, product_id__in={p for _, p in stock_by_pair})
+        .values('depot_id', 'product_id', 'date').annotate(bags=Sum('bags_sold')).order_by()
+    )
+    for row in sales:
+        stock_id = stock_by_pair.get((row['depot_id'], row['product_id']))
+        if stock_id is not None:
+            sale_bags[(stock_id, row['date'])] = row['bags'] or 0
+
+    for key in sorted(set(history_bags) | set(sale_bags)):
+        expected = sale_bags.get(key, 0)
+        found = history_bags.get(key, 0)
+        if expected != found:
+            discrepancies.append({
+                'stock_id': key[0],
+                'check': 'sale_bags',
+                'history_id': None,
+                'date': key[1],
+                'expected': expected,
+                'found': found,
+            })
+
+    return discrepancies
+
+
+def _partitions(stock_ids, count):
+    size = max(1, -(-len(stock_ids) // count))
+    return [stock_ids[i:i + size] for i in range(0, len(stock_ids), size)]
+
+
+def verify_all(workers=None):
+    """Verify every stock record, spreading the partitions over a process pool"""
+    stock_ids = list(Stock.objects.order_by('id').values_list('id', flat=True))
+    if not stock_ids:
+        return []
+
+    workers = workers or os.cpu_count() or 1
+    partitions = _partitions(stock_ids, workers * 4)
+    if workers <= 1 or len(partitions) <= 1:
+        results = [verify_partition(partition) for partition in partitions]
+    else:
+        # Forked workers must open their own connections rather than share the parent's
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            results = list(executor.map(verify_partition, partitions))
+
+    return [discrepancy for result in results for discrepancy in result]
+
+
+def repair(discrepancies):
+    """Append one correction entry per broken history chain, returning the entries created"""
+    broken = {d['stock_id'] for d in discrepancies if d['check'] in ('chain_gap', 'chain_end')}
+    if not broken:
+        return []
+
+    with transaction.atomic():
+        stocks = Stock.objects.select_for_update().in_bulk(broken)
+        last_entries = {}
+        for stock_id, new_quantity in (
+            StockHistory.objects.filter(stock_id__in=broken).order_by('stock_id', 'id')
+            .values_list('stock_id', 'new_quantity').iterator(chunk_size=2000)
+        ):
+            last_entries[stock_id] = new_quantity
+
+        corrections = []
+        for stock_id, stock in stocks.items():
+            previous_quantity = last_entries.get(stock_id, stock.quantity)
+            corrections.append(StockHistory(
+                stock=stock,
+                date=date.today(),
+                previous_quantity=previous_quantity,
+                new_quantity=stock.quantity,
+                change_type='correction',
+                description=(
+                    f"Integrity check correction: history reconciled to current stock of {stock.quantity} MT"
+                ),
+            ))
+        return bulk_create_history(corrections)
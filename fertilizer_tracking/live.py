@@ -0,0 +1,234 @@
+"""Live dashboard updates.
+
+Model changes are turned into small JSON deltas and published to a broker;
+the dashboard's server-sent events stream waits on the broker and forwards
+whatever has been published since the client's last event id.
+
+The broker is chosen by the LIVE_UPDATES_BROKER setting. InProcessBroker
+only reaches clients connected to the same process, so deployments with
+several workers should use CacheBroker with a memcached or redis cache.
+Event ids come from the cache's incr(), which only those backends make
+atomic across processes, so CacheBroker refuses any other backend.
+"""
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache.backends.memcached import BaseMemcachedCache
+from django.core.cache.backends.redis import RedisCache
+from django.core.exceptions import ImproperlyConfigured
+from django.contrib.humanize.templatetags.humanize import intcomma
+from django.core.cache import caches
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.template.defaultfilters import floatformat, truncatewords
+from django.utils.module_loading import import_string
+
+
+class InProcessBroker:
+    """Keeps the most recent events in memory and wakes waiting streams on publish"""
+
+    def __init__(self, history=200):
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=history)
+        self._last_id = 0
+
+    def last_event_id(self):
+        return self._last_id
+
+    def publish(self, event_type, data):
+        with self._condition:
+            self._last_id += 1
+            self._events.append((self._last_id, event_type, data))
+            self._condition.notify_all()
+
+    def wait(self, after_id, timeout):
+        """Return events newer than after_id, blocking up to timeout seconds for one"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._last_id > after_id, timeout)
+            return [event for event in self._events if event[0] > after_id]
+
+
+# Cache backends whose incr() is atomic across processes
+ATOMIC_INCR_BACKENDS = (BaseMemcachedCache, RedisCache)
+
+
+class CacheBroker:
+    """Shares events between worker processes through a Django cache"""
+
+    def __init__(self, alias='default', history=200, poll_interval=1.0, timeout=300):
+        self.cache = caches[alias]
+        if not isinstance(self.cache, ATOMIC_INCR_BACKENDS):
+            raise ImproperlyConfigured(
+                f"CacheBroker needs a memcached or redis cache; the '{alias}' cache "
+                f"({type(self.cache).__name__}) cannot allocate event ids atomically"
+            )
+        self.history = history
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.counter_key = 'live_updates:last_id'
+
+    def _key(self, event_id):
+        return f'live_updates:event:{event_id}'
+
+    def last_event_id(self):
+        return self.cache.get(self.counter_key, 0)
+
+    def publish(self, event_type, data):
+        self.cache.add(self.counter_key, 0, timeout=None)
+        event_id = self.cache.incr(self.counter_key)
+        self.cache.set(self._key(event_id), (event_id, event_type, data), timeout=self.timeout)
+
+    def wait(self, after_id, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            last_id = self.last_event_id()
+            if last_id > after_id:
+                first_id = max(after_id + 1, last_id - self.history + 1)
+                found = self.cache.get_many([self._key(i) for i in range(first_id, last_id + 1)])
+                return sorted(found.values())
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return []
+            time.sleep(min(self.poll_interval, remaining))
+
+
+@checks.register()
+def check_broker(app_configs, **kwargs):
+    """Report a CacheBroker configured on a cache that can't allocate event ids safely"""
+    broker_class = import_string(getattr(settings, 'LIVE_UPDATES_BROKER', 'fertilizer_tracking.live.InProcessBroker'))
+    if not issubclass(broker_class, CacheBroker):
+        return []
+    alias = getattr(settings, 'LIVE_UPDATES_BROKER_OPTIONS', {}).get('alias', 'default')
+    if isinstance(caches[alias], ATOMIC_INCR_BACKENDS):
+        return []
+    return [checks.Error(
+        f"LIVE_UPDATES_BROKER is CacheBroker but the '{alias}' cache is not memcached or redis",
+        hint='Its incr() is not atomic across processes, so concurrent publishes could share an event id.',
+        id='fertilizer_tracking.E001',
+    )]
+
+
+class EventStream:
+    """Server-sent events framing shared by the WSGI and ASGI streams.
+
+    The stream waits for events in steps of at most heartbeat seconds until
+    lifetime runs out, or, as a long poll, until the first events arrive.
+    """
+
+    def __init__(self, after_id, lifetime, heartbeat, long_poll=False):
+        self.after_id = after_id
+        self.deadline = time.monotonic() + lifetime
+        self.heartbeat = heartbeat
+        self.long_poll = long_poll
+        self.done = False
+
+    def preamble(self):
+        # A long poll ends after the first batch of events and the browser reconnects almost at once;
+        # the id line makes a reconnect resume from here even if no event arrived
+        return f"retry: {250 if self.long_poll else 3000}\nid: {self.after_id}\n\n"
+
+    def next_timeout(self):
+        """Seconds to wait for the next events, or None once the stream should end"""
+        remaining = self.deadline - time.monotonic()
+        if self.done or remaining <= 0:
+            return None
+        return min(self.heartbeat, remaining)
+
+    def frames(self, events):
+        if not events:
+            return ": keep-alive\n\n"
+        self.after_id = events[-1][0]
+        self.done = self.long_poll
+        return ''.join(
+            f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n"
+            for event_id, event_type, data in events
+        )
+
+
+# Threads the ASGI streams block in while waiting on the broker. Keeping them
+# out of the default executor means open dashboards can't starve other
+# sync_to_async calls; streams beyond the limit queue for a thread.
+stream_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'LIVE_UPDATES_STREAM_WORKERS', 32),
+    thread_name_prefix='live-stream',
+)
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker_class = import_string(getattr(
+                    settings, 'LIVE_UPDATES_BROKER', 'fertilizer_tracking.live.InProcessBroker'
+                ))
+                _broker = broker_class(**getattr(settings, 'LIVE_UPDATES_BROKER_OPTIONS', {}))
+    return _broker
+
+
+def money(value):
+    return f"K{intcomma(floatformat(value, 2))}"
+
+
+def stock_event(stock):
+    from .models import ProductPrice, Stock
+
+    current_price = ProductPrice.objects.filter(
+        product=OuterRef('product'), effective_from__lte=date.today()
+    ).order_by('-effective_from').values('price_per_bag')[:1]
+    totals = Stock.objects.aggregate(
+        total_value=Sum(F('quantity') * 20 * Coalesce(Subquery(current_price), F('product__price_per_bag'))),
+        total_quantity=Sum('quantity'),
+    )
+    return {
+        'id': stock.pk,
+        'quantity': floatformat(stock.quantity, 2),
+        'available_bags': intcomma(stock.get_available_bags()),
+        'monetary_value': money(stock.get_monetary_value()),
+        'total_stock_value': money(totals['total_value'] or 0),
+        'total_available_bags': intcomma(int((totals['total_quantity'] or 0) * 20)),
+    }
+
+
+def sales_totals_event():
+    from .models import DailySale
+
+    totals = DailySale.objects.aggregate(Sum('total_amount'), Sum('commission_earned'))
+    return {
+        'total_overall_sales': money(totals['total_amount__sum'] or 0),
+        'total_overall_commissions': money(totals['commission_earned__sum'] or 0),
+    }
+
+
+def payment_event(payment):
+    return {
+        'id': payment.pk,
+        'date': str(payment.date),
+        'payment_type': payment.payment_type,
+        'payment_type_display': payment.get_payment_type_display(),
+        'amount': money(payment.amount),
+        'description': truncatewords(payment.description, 3),
+    }
+
+
+def stock_history_event(record):
+    change = record.quantity_change
+    return {
+        'id': record.pk,
+        'date': str(record.date),
+        'depot': record.stock.depot.name if record.stock.depot else '',
+        'product': record.stock.product.name if record.stock.product else '',
+        'quantity_change': f"{'+' if change > 0 else ''}{floatformat(change, 2)} MT",
+        'direction': 'up' if change > 0 else 'down' if change < 0 else '',
+        'change_type': record.change_type,
+        'change_type_display': record.get_change_type_display(),
+    }
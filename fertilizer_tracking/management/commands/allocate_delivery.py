@@ -0,0 +1,76 @@
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fertilizer_tracking.allocation import AllocationError, apply_allocation, plan_allocation
+from fertilizer_tracking.models import Product
+
+class Command(BaseCommand):
+    help = 'Split an incoming UCF delivery across depots to balance days of cover, and optionally apply it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('delivery', nargs='+', help="Incoming quantity per product as 'PRODUCT=MT', e.g. 'UREA=120'")
+        parser.add_argument('--days', type=int, help='Days of sales used to measure velocity (defaults to ALLOCATION_VELOCITY_DAYS)')
+        parser.add_argument('--date', help='Delivery date as YYYY-MM-DD (defaults to today)')
+        parser.add_argument('--reference', default='', help='Consignment reference recorded in the stock history')
+        parser.add_argument('--apply', action='store_true', help='Add the plan to stock after showing it')
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive', help='Apply without asking for confirmation')
+
+    def parse_delivery(self, items):
+        products = {product.name.strip().upper(): product for product in Product.objects.all() if product.name}
+        incoming = {}
+        for item in items:
+            name, _, quantity = item.rpartition('=')
+            product = products.get(name.strip().upper())
+            if product is None:
+                raise CommandError(f"Unknown product '{name.strip()}'")
+            try:
+                quantity = Decimal(quantity)
+                # NaN and Infinity parse as decimals but can't be quantized or compared
+                quantity = quantity.quantize(Decimal('0.01')) if quantity.is_finite() else None
+            except InvalidOperation:
+                quantity = None
+            if quantity is None or quantity <= 0:
+                raise CommandError(f"Invalid quantity in '{item}', expected a positive number of MT")
+            incoming[product] = incoming.get(product, 0) + quantity
+        return incoming
+
+    def handle(self, *args, **options):
+        try:
+            delivery_date = date.fromisoformat(options['date']) if options['date'] else date.today()
+        except ValueError:
+            raise CommandError(f"Invalid date '{options['date']}', expected YYYY-MM-DD")
+        if options['days'] is not None and options['days'] < 1:
+            raise CommandError('--days must be at least 1')
+
+        incoming = self.parse_delivery(options['delivery'])
+        try:
+            lines, unallocated = plan_allocation(incoming, days=options['days'])
+        except AllocationError as e:
+            raise CommandError(str(e))
+
+        def days(cover):
+            return f"{cover:.1f}" if cover is not None else '-'
+
+        self.stdout.write(
+            f"{'Depot':<20} {'Product':<15} {'Stock MT':>10} {'MT/day':>8} {'Cover':>8} {'Allocate':>10} {'Cover after':>12}"
+        )
+        self.stdout.write("-" * 89)
+        for line in lines:
+            self.stdout.write(
+                f"{line['depot'].name:<20} {line['product'].name:<15} {line['current']:>10} {line['velocity']:>8.2f} "
+                f"{days(line['cover_before']):>8} {line['quantity']:>10} {days(line['cover_after']):>12}"
+            )
+        for product, quantity in unallocated.items():
+            self.stdout.write(self.style.WARNING(f"{quantity} MT of {product.name} does not fit within depot capacity"))
+
+        if not options['apply'] or not lines:
+            return
+        if options['interactive']:
+            answer = input('Apply this allocation to stock? Type \'yes\' to continue: ')
+            if answer != 'yes':
+                raise CommandError('Allocation cancelled')
+
+        created = apply_allocation(lines, delivery_date, options['reference'])
+        self.stdout.write(self.style.SUCCESS(f"Added stock at {len(created)} depot and product pairs"))
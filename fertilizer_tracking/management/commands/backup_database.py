@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from fertilizer_tracking.backups import BackupError, create_backup, list_backups, prune_backups, verify_backup
+
+class Command(BaseCommand):
+    help = 'Take an online, compressed and checksummed snapshot of the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to back up')
+        parser.add_argument('--output-dir', help='Directory for snapshots (defaults to BACKUP_DIR)')
+        parser.add_argument('--keep', type=int, default=getattr(settings, 'BACKUP_KEEP', 14), help='Number of snapshots to keep')
+        parser.add_argument('--pages', type=int, default=256, help='SQLite pages copied per step')
+        parser.add_argument('--sleep', type=float, default=0.05, help='Seconds to pause between SQLite copy steps')
+        parser.add_argument('--verify', action='store_true', help='Re-read the snapshot after writing it and check its contents')
+        parser.add_argument('--list', action='store_true', help='List existing snapshots instead of taking one')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for path in list_backups(options['database'], options['output_dir']):
+                self.stdout.write(path)
+            return
+
+        if options['keep'] < 1:
+            raise CommandError('--keep must be at least 1')
+
+        try:
+            path = create_backup(
+                options['database'],
+                directory=options['output_dir'],
+                pages=options['pages'],
+                sleep=options['sleep'],
+            )
+            if options['verify']:
+                verify_backup(path)
+        except BackupError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"Snapshot written to {path}")
+        for removed in prune_backups(options['keep'], options['database'], options['output_dir']):
+            self.stdout.write(f"Removed old snapshot {removed}")
+        self.stdout.write(self.style.SUCCESS('Backup completed!'))
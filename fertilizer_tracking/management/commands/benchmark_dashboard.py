@@ -0,0 +1,52 @@
+import statistics
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+PAGES = [
+    ('dashboard', '/', '/async/'),
+    ('ucf balance', '/ucf-balance/', '/async/ucf-balance/'),
+]
+
+class Command(BaseCommand):
+    help = (
+        'Compare latency of the sync and async dashboard/UCF balance views against a running server, '
+        'e.g. one started with "uvicorn fertilizer_mgmt.asgi:application"'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000', help='Server to benchmark')
+        parser.add_argument('--requests', type=int, default=100, help='Requests per view')
+        parser.add_argument('--concurrency', type=int, default=10, help='Simultaneous requests')
+
+    def fetch(self, url):
+        start = time.perf_counter()
+        with urllib.request.urlopen(url) as response:
+            response.read()
+        return (time.perf_counter() - start) * 1000
+
+    def measure(self, url, total, concurrency):
+        # Warm up connections and caches before timing
+        self.fetch(url)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return sorted(executor.map(self.fetch, [url] * total))
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'].rstrip('/')
+        total = options['requests']
+        concurrency = options['concurrency']
+
+        self.stdout.write(f"{'View':<15} {'Mode':<6} {'Mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+        self.stdout.write("-" * 52)
+        for name, sync_path, async_path in PAGES:
+            for mode, path in [('sync', sync_path), ('async', async_path)]:
+                try:
+                    timings = self.measure(base_url + path, total, concurrency)
+                except OSError as e:
+                    raise CommandError(f"Could not reach {base_url + path}: {e}")
+                p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                self.stdout.write(
+                    f"{name:<15} {mode:<6} {statistics.mean(timings):>9.1f} {statistics.median(timings):>9.1f} {p95:>9.1f}"
+                )
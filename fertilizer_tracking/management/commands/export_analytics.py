@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from fertilizer_tracking.exports import EXPORT_FORMATS, EXPORT_TABLES, export_incremental
+
+class Command(BaseCommand):
+    help = 'Export sales, UCF payments and stock history to Parquet or Arrow files for analytics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', default='analytics_export', help='Directory to write export files into')
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='parquet', help='File format')
+        parser.add_argument('--table', action='append', choices=EXPORT_TABLES, help='Table to export (repeatable, defaults to all)')
+        parser.add_argument('--full', action='store_true', help='Export every row instead of only rows added or changed since the last export')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows per record batch')
+
+    def handle(self, *args, **options):
+        try:
+            results = export_incremental(
+                options['output_dir'],
+                tables=options['table'] or EXPORT_TABLES,
+                fmt=options['format'],
+                full=options['full'],
+                batch_size=options['batch_size'],
+            )
+        except ImportError:
+            raise CommandError('Analytics exports require pyarrow to be installed')
+
+        for table, path, total in results:
+            self.stdout.write(f"{table}: {total} rows -> {path}")
+        if not results:
+            self.stdout.write('No new or changed rows to export')
+        self.stdout.write(self.style.SUCCESS('Export completed!'))
@@ -0,0 +1,43 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fertilizer_tracking.statements import (
+    STATEMENT_FORMATS, build_commission_statements, parse_month, render_statements,
+)
+
+class Command(BaseCommand):
+    help = 'Generate monthly commission statements for every depot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='Month to report on as YYYY-MM (defaults to the current month)')
+        parser.add_argument('--format', choices=STATEMENT_FORMATS, default='txt', help='Statement document format')
+        parser.add_argument('--output-dir', default='commission_statements', help='Directory to write statements into')
+        parser.add_argument('--workers', type=int, default=None, help='Number of rendering processes (defaults to CPU count)')
+
+    def handle(self, *args, **options):
+        try:
+            year, month = parse_month(options['month'])
+            statements = build_commission_statements(year, month)
+        except ValueError:
+            raise CommandError(f"Invalid month '{options['month']}', expected YYYY-MM")
+
+        if not statements:
+            self.stdout.write(f"No sales recorded for {year}-{month:02d}")
+            return
+
+        try:
+            documents = render_statements(statements, options['format'], workers=options['workers'])
+        except ImportError:
+            raise CommandError('PDF statements require reportlab to be installed')
+
+        output_dir = options['output_dir']
+        os.makedirs(output_dir, exist_ok=True)
+        for filename, content in documents:
+            with open(os.path.join(output_dir, filename), 'wb') as f:
+                f.write(content)
+
+        total_commission = sum(statement['total_commission'] for statement in statements)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(documents)} statements to {output_dir} (total commission K{total_commission:.2f})"
+        ))
@@ -0,0 +1,241 @@
+import itertools
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from http.cookiejar import CookieJar
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Min
+from django.urls import reverse
+
+from fertilizer_tracking.models import DailySale, Stock, UCFPayment
+
+ACTIONS = ('sale', 'payment', 'stock', 'dashboard')
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+class ServerTransport:
+    """Talks to a running server over HTTP, keeping the clerk's session and CSRF cookie"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), NoRedirect())
+
+    def _open(self, request):
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        # Any page with a form sets the cookie
+        self.get(reverse('record_payment'))
+        return next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), '')
+
+    def get(self, path):
+        return self._open(urllib.request.Request(self.base_url + path))
+
+    def post(self, path, data):
+        data = dict(data, csrfmiddlewaretoken=self.csrf_token())
+        body = urllib.parse.urlencode(data).encode()
+        return self._open(urllib.request.Request(self.base_url + path, data=body))
+
+class ClientTransport:
+    """Runs requests in-process through Django's test client"""
+
+    def __init__(self):
+        from django.test import Client
+        self.client = Client(raise_request_exception=False)
+
+    def get(self, path):
+        return self.client.get(path).status_code
+
+    def post(self, path, data):
+        return self.client.post(path, data).status_code
+
+class Command(BaseCommand):
+    help = (
+        'Simulate several clerks recording sales, payments and stock updates while others poll the dashboard, '
+        'then check the final stock against what the successful requests should have left. '
+        'Writes real rows, so run it against a scratch copy of the database (see backup_database). '
+        'With --base-url the server must use the same database as this command.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clerks', type=int, default=8, help='Simultaneous clerks (threads)')
+        parser.add_argument('--actions', type=int, default=50, help='Actions per clerk')
+        parser.add_argument('--base-url', help='Running server to load, e.g. http://127.0.0.1:8000 (defaults to the in-process test client)')
+        parser.add_argument('--mix', default='sale=40,payment=15,stock=15,dashboard=30', help='Relative weights of sale, payment, stock and dashboard actions')
+        parser.add_argument('--max-bags', type=int, default=20, help='Largest sale a clerk records')
+        parser.add_argument('--seed', type=int, help='Random seed for a repeatable run')
+
+    def parse_mix(self, mix):
+        weights = {}
+        for part in mix.split(','):
+            name, _, weight = part.partition('=')
+            name = name.strip()
+            if name not in ACTIONS:
+                raise CommandError(f"Unknown action '{name}' in --mix; choose from {', '.join(ACTIONS)}")
+            try:
+                weights[name] = float(weight)
+            except ValueError:
+                raise CommandError(f"Invalid weight '{weight}' for {name}")
+        if sum(weights.values()) <= 0:
+            raise CommandError('--mix needs at least one positive weight')
+        return list(weights), list(weights.values())
+
+    def handle(self, *args, **options):
+        clerks = options['clerks']
+        actions_per_clerk = options['actions']
+        if clerks < 1 or actions_per_clerk < 1:
+            raise CommandError('--clerks and --actions must be at least 1')
+        names, weights = self.parse_mix(options['mix'])
+
+        stocks = list(Stock.objects.filter(depot__isnull=False, product__isnull=False).select_related('depot', 'product'))
+        if not stocks:
+            raise CommandError('No stock records to load-test against; run setup_initial_data first')
+        initial = {stock.pk: stock.quantity for stock in stocks}
+        payments_before = UCFPayment.objects.count()
+
+        # Sales are unique per (date, depot, product), so every simulated sale
+        # gets its own date, counting forward to just before the earliest real sale
+        total_actions = clerks * actions_per_clerk
+        earliest = DailySale.objects.aggregate(Min('date'))['date__min'] or date.today()
+        first_sale_date = earliest - timedelta(days=total_actions + 1)
+        sale_days = itertools.count()
+        sale_days_lock = threading.Lock()
+
+        results_lock = threading.Lock()
+        timings = defaultdict(list)
+        outcomes = defaultdict(lambda: defaultdict(int))
+        expected_change = defaultdict(Decimal)
+        payments_made = [0]
+
+        def record(action, status, elapsed_ms, stock=None, change=None):
+            with results_lock:
+                timings[action].append(elapsed_ms)
+                if status is None or status >= 500:
+                    outcomes[action]['error'] += 1
+                elif action != 'dashboard' and status != 302:
+                    # Forms re-render with 200 when validation fails, e.g. insufficient stock
+                    outcomes[action]['rejected'] += 1
+                else:
+                    outcomes[action]['ok'] += 1
+                    if change is not None:
+                        expected_change[stock.pk] += change
+                    if action == 'payment':
+                        payments_made[0] += 1
+
+        def clerk(number):
+            rng = random.Random(None if options['seed'] is None else options['seed'] + number)
+            transport = ServerTransport(options['base_url']) if options['base_url'] else ClientTransport()
+            try:
+                for _ in range(actions_per_clerk):
+                    action = rng.choices(names, weights)[0]
+                    stock = rng.choice(stocks)
+                    change = None
+                    if action == 'sale':
+                        with sale_days_lock:
+                            sale_date = first_sale_date + timedelta(days=next(sale_days))
+                        bags = rng.randint(1, options['max_bags'])
+                        change = -Decimal(bags) / Decimal(20)
+                        path, data = reverse('record_sale'), {
+                            'date': sale_date.isoformat(),
+                            'depot': stock.depot_id,
+                            'product': stock.product_id,
+                            'bags_sold': bags,
+                        }
+                    elif action == 'payment':
+                        path, data = reverse('record_payment'), {
+                            'date': date.today().isoformat(),
+                            'payment_type': rng.choice(['payment', 'receipt']),
+                            'amount': f"{rng.randint(100, 5000)}.00",
+                            'description': f"Load test payment by clerk {number}",
+                            'reference_number': f"LOAD-{number}-{rng.randint(0, 10 ** 6)}",
+                        }
+                    elif action == 'stock':
+                        # Like a clerk with the form open: read the quantity, then submit it plus a delivery
+                        change = Decimal(rng.randint(1, 40)) / Decimal(20)
+                        current = Stock.objects.values_list('quantity', flat=True).get(pk=stock.pk)
+                        path, data = reverse('update_stock', args=[stock.pk]), {
+                            'quantity': current + change,
+                            'change_type': 'addition',
+                            'description': f"Load test delivery by clerk {number}",
+                        }
+                    else:
+                        path, data = reverse('dashboard'), None
+
+                    start = time.perf_counter()
+                    try:
+                        status = transport.get(path) if data is None else transport.post(path, data)
+                    except OSError:
+                        status = None
+                    record(action, status, (time.perf_counter() - start) * 1000, stock, change)
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clerks) as executor:
+            list(executor.map(clerk, range(1, clerks + 1)))
+        elapsed = time.perf_counter() - started
+
+        all_timings = sorted(t for values in timings.values() for t in values)
+        self.stdout.write(
+            f"{len(all_timings)} requests from {clerks} clerks in {elapsed:.1f}s "
+            f"({len(all_timings) / elapsed:.1f} req/s)"
+        )
+        self.stdout.write(
+            f"{'Action':<10} {'Count':>6} {'OK':>6} {'Rejected':>9} {'Errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+        )
+        self.stdout.write("-" * 71)
+        for action in names:
+            values = sorted(timings[action])
+            if not values:
+                continue
+            counts = outcomes[action]
+            self.stdout.write(
+                f"{action:<10} {len(values):>6} {counts['ok']:>6} {counts['rejected']:>9} {counts['error']:>7} "
+                f"{statistics.median(values):>9.1f} {percentile(values, 0.95):>9.1f} {percentile(values, 0.99):>9.1f}"
+            )
+        errors = sum(counts['error'] for counts in outcomes.values())
+        self.stdout.write(f"Error rate: {errors / len(all_timings):.1%}")
+
+        mismatches = []
+        final = dict(Stock.objects.filter(pk__in=initial).values_list('pk', 'quantity'))
+        for stock in stocks:
+            expected = initial[stock.pk] + expected_change[stock.pk]
+            if final[stock.pk] != expected:
+                mismatches.append(
+                    f"{stock.depot.name} - {stock.product.name}: expected {expected} MT, found {final[stock.pk]} MT"
+                )
+        payments_after = UCFPayment.objects.count()
+        if payments_after - payments_before != payments_made[0]:
+            mismatches.append(
+                f"UCF payments: {payments_made[0]} recorded successfully, {payments_after - payments_before} rows created"
+            )
+
+        if mismatches:
+            for line in mismatches:
+                self.stdout.write(self.style.ERROR(line))
+            raise CommandError(f"{len(mismatches)} totals differ from what the successful requests imply")
+        self.stdout.write(self.style.SUCCESS('Final stock matches the expected totals'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from fertilizer_tracking.search import rebuild_index
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for stock history and UCF payments'
+
+    def handle(self, *args, **options):
+        total = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} records"))
@@ -0,0 +1,51 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fertilizer_tracking.reconciliation import reconcile_statement
+
+class Command(BaseCommand):
+    help = 'Reconcile a UCF or bank statement CSV against recorded UCF payments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('statement', help='Path to the statement CSV file')
+        parser.add_argument('--tolerance-days', type=int, default=3, help='Days either side of the statement date to match amounts on')
+        parser.add_argument('--output', help='Write a CSV report of every statement line to this path')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['statement'], newline='', encoding='utf-8-sig') as stream:
+                result = reconcile_statement(stream, tolerance_days=options['tolerance_days'])
+        except OSError as e:
+            raise CommandError(f"Could not read statement: {e}")
+        except (ValueError, csv.Error) as e:
+            raise CommandError(f"Could not reconcile statement: {e}")
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['Line', 'Date', 'Reference', 'Amount', 'Status', 'Payment IDs', 'Reason'])
+                for status, items in [('matched', result.matched), ('ambiguous', result.ambiguous), ('unmatched', result.unmatched)]:
+                    for item in items:
+                        line = item['line']
+                        writer.writerow([
+                            line['line_number'], line['date'] or '', line['reference'], line['amount'] or '',
+                            status, ' '.join(str(p['id']) for p in item['payments']), item['reason'],
+                        ])
+
+        for item in result.ambiguous:
+            line = item['line']
+            self.stdout.write(self.style.WARNING(
+                f"Line {line['line_number']}: {line['date']} {line['reference']} K{line['amount']} - {item['reason']}"
+            ))
+        for item in result.unmatched:
+            line = item['line']
+            self.stdout.write(self.style.ERROR(
+                f"Line {line['line_number']}: {line['date']} {line['reference']} K{line['amount']} - {item['reason']}"
+            ))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {result.lines_processed} lines: {len(result.matched)} matched, "
+            f"{len(result.ambiguous)} ambiguous, {len(result.unmatched)} unmatched; "
+            f"{len(result.unmatched_payments)} recorded payments not on the statement"
+        ))
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from fertilizer_tracking.backups import copy_sqlite
+from fertilizer_tracking.routers import replica_alias
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database over the local read replica, once or every --interval seconds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help='Seconds between refreshes; 0 refreshes once')
+        parser.add_argument('--pages', type=int, default=256, help='Pages copied per step')
+        parser.add_argument('--sleep', type=float, default=0.05, help='Seconds to pause between copy steps')
+
+    def handle(self, *args, **options):
+        alias = replica_alias()
+        if alias is None:
+            raise CommandError('No replica database is configured; add REPLICA_DATABASE to DATABASES')
+        if connections['default'].vendor != 'sqlite' or connections[alias].vendor != 'sqlite':
+            raise CommandError('refresh_replica only copies SQLite databases; use the database\'s own replication otherwise')
+
+        primary = str(connections['default'].settings_dict['NAME'])
+        replica = str(connections[alias].settings_dict['NAME'])
+        while True:
+            start = time.perf_counter()
+            connections[alias].close()
+            copy_sqlite(primary, replica, options['pages'], options['sleep'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Replica refreshed from {primary} in {time.perf_counter() - start:.2f}s"
+            ))
+            if options['interval'] <= 0:
+                break
+            time.sleep(options['interval'])
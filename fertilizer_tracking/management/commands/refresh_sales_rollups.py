@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from fertilizer_tracking.rollups import refresh_rollups
+
+class Command(BaseCommand):
+    help = 'Refresh the weekly, monthly and seasonal sales rollups for recently changed sales'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild every rollup from scratch')
+
+    def handle(self, *args, **options):
+        processed = refresh_rollups(full=options['full'])
+        if options['full']:
+            self.stdout.write(self.style.SUCCESS('Rebuilt all sales rollups'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Refreshed rollups for {processed} changed sale dates"))
@@ -0,0 +1,29 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fertilizer_tracking.models import Product
+from fertilizer_tracking.pricing import reprice_sales
+
+class Command(BaseCommand):
+    help = 'Recompute sale amounts and commissions from the product prices in effect on each sale date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', help='Only reprice sales of this product (by name)')
+        parser.add_argument('--since', help='Only reprice sales on or after this date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        product = None
+        if options['product']:
+            try:
+                product = Product.objects.get(name__iexact=options['product'])
+            except Product.DoesNotExist:
+                raise CommandError(f"Unknown product '{options['product']}'")
+
+        try:
+            since = date.fromisoformat(options['since']) if options['since'] else None
+        except ValueError:
+            raise CommandError(f"Invalid date '{options['since']}', expected YYYY-MM-DD")
+
+        updated, dates = reprice_sales(product=product, since=since)
+        self.stdout.write(self.style.SUCCESS(f"Repriced {updated} sales across {dates} dates"))
@@ -0,0 +1,42 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+from fertilizer_tracking.backups import BackupError, list_backups, restore_backup, verify_backup
+
+class Command(BaseCommand):
+    help = 'Verify a database snapshot and restore it over the live database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('backup', nargs='?', help='Snapshot file to restore (defaults to the newest)')
+        parser.add_argument('--database', default='default', help='Database alias to restore into')
+        parser.add_argument('--backup-dir', help='Directory to look for the newest snapshot in (defaults to BACKUP_DIR)')
+        parser.add_argument('--verify-only', action='store_true', help='Check the snapshot without restoring it')
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive', help='Do not ask for confirmation')
+
+    def handle(self, *args, **options):
+        path = options['backup']
+        if not path:
+            backups = list_backups(options['database'], options['backup_dir'])
+            if not backups:
+                raise CommandError('No snapshots found')
+            path = backups[0]
+
+        try:
+            verify_backup(path)
+            self.stdout.write(f"{path} verified")
+            if options['verify_only']:
+                return
+
+            if options['interactive']:
+                answer = input(f"This will replace the '{options['database']}' database with {path}. Type 'yes' to continue: ")
+                if answer != 'yes':
+                    raise CommandError('Restore cancelled')
+
+            restore_backup(path, options['database'])
+        except BackupError as e:
+            raise CommandError(str(e))
+
+        # Cached pages and depot summaries describe the database that was replaced
+        cache.clear()
+
+        self.stdout.write(self.style.SUCCESS('Restore completed!'))
@@ -0,0 +1,30 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fertilizer_tracking.transfers import TransferError, execute_transfers, parse_transfer_lines
+
+class Command(BaseCommand):
+    help = 'Apply a redistribution plan of stock transfers between depots in one transaction'
+
+    def add_arguments(self, parser):
+        parser.add_argument('plan', help="File with one 'source, destination, product, quantity[, note]' line per transfer")
+        parser.add_argument('--date', help='Transfer date as YYYY-MM-DD (defaults to today)')
+        parser.add_argument('--notes', default='', help='Notes recorded on every transfer')
+
+    def handle(self, *args, **options):
+        try:
+            transfer_date = date.fromisoformat(options['date']) if options['date'] else date.today()
+        except ValueError:
+            raise CommandError(f"Invalid date '{options['date']}', expected YYYY-MM-DD")
+
+        try:
+            with open(options['plan']) as f:
+                lines = parse_transfer_lines(f.read())
+            transfers = execute_transfers(lines, transfer_date, options['notes'])
+        except OSError as e:
+            raise CommandError(f"Could not read plan: {e}")
+        except TransferError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f"Recorded {len(transfers)} stock transfers"))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from fertilizer_tracking.integrity import repair, verify_all
+from fertilizer_tracking.models import Stock
+
+CHECK_LABELS = {
+    'chain_gap': 'History gap',
+    'chain_end': 'History does not end at current stock',
+    'sale_bags': 'Sale history bags differ from recorded sales',
+}
+
+class Command(BaseCommand):
+    help = 'Check that stock quantities, stock history and daily sales agree'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Number of verifier processes (defaults to CPU count)')
+        parser.add_argument('--repair', action='store_true', help="Write 'correction' history entries for broken history chains")
+
+    def handle(self, *args, **options):
+        discrepancies = verify_all(workers=options['workers'])
+
+        stocks = Stock.objects.select_related('depot', 'product').in_bulk({d['stock_id'] for d in discrepancies})
+        for d in discrepancies:
+            detail = f" on {d['date']}" if d['date'] else ''
+            entry = f" (history #{d['history_id']})" if d['history_id'] else ''
+            self.stdout.write(self.style.WARNING(
+                f"{stocks[d['stock_id']]}: {CHECK_LABELS[d['check']]}{detail}{entry} - "
+                f"expected {d['expected']}, found {d['found']}"
+            ))
+
+        if not discrepancies:
+            self.stdout.write(self.style.SUCCESS('Stock, history and sales are consistent'))
+            return
+
+        self.stdout.write(f"Found {len(discrepancies)} discrepancies")
+        if options['repair']:
+            corrections = repair(discrepancies)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(corrections)} correction history entries"))
+            if any(d['check'] == 'sale_bags' for d in discrepancies):
+                self.stdout.write(self.style.WARNING('Sale bag mismatches need to be checked by hand'))
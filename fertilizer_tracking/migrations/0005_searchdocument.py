@@ -0,0 +1,91 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:09
+
+from django.db import migrations, models
+
+SQLITE_FTS_SQL = [
+    "CREATE VIRTUAL TABLE fertilizer_tracking_searchdocument_fts USING fts5("
+    "content, content='fertilizer_tracking_searchdocument', content_rowid='id')",
+    "CREATE TRIGGER fertilizer_tracking_searchdocument_ai AFTER INSERT ON fertilizer_tracking_searchdocument BEGIN "
+    "INSERT INTO fertilizer_tracking_searchdocument_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER fertilizer_tracking_searchdocument_ad AFTER DELETE ON fertilizer_tracking_searchdocument BEGIN "
+    "INSERT INTO fertilizer_tracking_searchdocument_fts(fertilizer_tracking_searchdocument_fts, rowid, content) "
+    "VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER fertilizer_tracking_searchdocument_au AFTER UPDATE ON fertilizer_tracking_searchdocument BEGIN "
+    "INSERT INTO fertilizer_tracking_searchdocument_fts(fertilizer_tracking_searchdocument_fts, rowid, content) "
+    "VALUES ('delete', old.id, old.content); "
+    "INSERT INTO fertilizer_tracking_searchdocument_fts(rowid, content) VALUES (new.id, new.content); END",
+]
+
+SQLITE_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS fertilizer_tracking_searchdocument_ai",
+    "DROP TRIGGER IF EXISTS fertilizer_tracking_searchdocument_ad",
+    "DROP TRIGGER IF EXISTS fertilizer_tracking_searchdocument_au",
+    "DROP TABLE IF EXISTS fertilizer_tracking_searchdocument_fts",
+]
+
+POSTGRES_FTS_SQL = [
+    "CREATE INDEX fertilizer_tracking_searchdocument_tsv ON fertilizer_tracking_searchdocument "
+    "USING GIN (to_tsvector('english', content))",
+]
+
+POSTGRES_DROP_SQL = [
+    "DROP INDEX IF EXISTS fertilizer_tracking_searchdocument_tsv",
+]
+
+
+def create_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'sqlite': SQLITE_FTS_SQL, 'postgresql': POSTGRES_FTS_SQL}.get(vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'sqlite': SQLITE_DROP_SQL, 'postgresql': POSTGRES_DROP_SQL}.get(vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def backfill_documents(apps, schema_editor):
+    SearchDocument = apps.get_model('fertilizer_tracking', 'SearchDocument')
+    StockHistory = apps.get_model('fertilizer_tracking', 'StockHistory')
+    UCFPayment = apps.get_model('fertilizer_tracking', 'UCFPayment')
+
+    documents = [
+        SearchDocument(kind='stock_history', object_id=h.pk, date=h.date, content=h.description or '')
+        for h in StockHistory.objects.all()
+    ]
+    documents += [
+        SearchDocument(
+            kind='ucf_payment', object_id=p.pk, date=p.date,
+            content=f"{p.reference_number} {p.description}".strip(),
+        )
+        for p in UCFPayment.objects.all()
+    ]
+    SearchDocument.objects.bulk_create(documents, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fertilizer_tracking', '0004_stockhistory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('stock_history', 'Stock History'), ('ucf_payment', 'UCF Payment')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('date', models.DateField()),
+                ('content', models.TextField()),
+            ],
+            options={
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(backfill_documents, migrations.RunPython.noop),
+    ]
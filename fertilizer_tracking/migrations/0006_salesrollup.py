@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def mark_existing_sales_pending(apps, schema_editor):
+    DailySale = apps.get_model('fertilizer_tracking', 'DailySale')
+    SalesRollupPending = apps.get_model('fertilizer_tracking', 'SalesRollupPending')
+    dates = DailySale.objects.values_list('date', flat=True).distinct()
+    SalesRollupPending.objects.bulk_create([SalesRollupPending(date=d) for d in dates], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fertilizer_tracking', '0005_searchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollupPending',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('week', 'Week'), ('month', 'Month'), ('season', 'Season')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('bags_sold', models.IntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('commission_earned', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('depot', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='fertilizer_tracking.depot')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='fertilizer_tracking.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['granularity', 'period_start'], name='fertilizer__granula_d25576_idx')],
+                'unique_together': {('granularity', 'period_start', 'depot', 'product')},
+            },
+        ),
+        migrations.RunPython(mark_existing_sales_pending, migrations.RunPython.noop),
+    ]
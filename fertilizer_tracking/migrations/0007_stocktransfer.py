@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:16
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fertilizer_tracking', '0006_salesrollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stockhistory',
+            name='change_type',
+            field=models.CharField(choices=[('addition', 'Stock Addition'), ('sale', 'Stock Sale'), ('adjustment', 'Stock Adjustment'), ('correction', 'Stock Correction'), ('transfer_out', 'Transfer Out'), ('transfer_in', 'Transfer In')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='StockTransfer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)])),
+                ('notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('destination_depot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transfers_in', to='fertilizer_tracking.depot')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='fertilizer_tracking.product')),
+                ('source_depot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transfers_out', to='fertilizer_tracking.depot')),
+            ],
+            options={
+                'ordering': ['-date', '-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='stockhistory',
+            name='transfer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='history', to='fertilizer_tracking.stocktransfer'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fertilizer_tracking', '0007_stocktransfer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('effective_from', models.DateField()),
+                ('price_per_bag', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('commission_per_bag', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prices', to='fertilizer_tracking.product')),
+            ],
+            options={
+                'ordering': ['product', '-effective_from'],
+                'unique_together': {('product', 'effective_from')},
+            },
+        ),
+    ]
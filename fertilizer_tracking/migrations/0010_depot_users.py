@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fertilizer_tracking', '0009_exportwatermark'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='depot',
+            name='users',
+            field=models.ManyToManyField(blank=True, related_name='depots', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fertilizer_tracking', '0010_depot_users'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='depot',
+            name='capacity',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Storage capacity in MT across all products; leave blank for no limit', max_digits=10, null=True),
+        ),
+    ]
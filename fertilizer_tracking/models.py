@@ -1,7 +1,10 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 from django.db.models import Sum
 from decimal import Decimal
+from datetime import date
 
 class Depot(models.Model):
     name = models.CharField(max_length=100)
@@ -9,6 +12,12 @@ class Depot(models.Model):
     manager = models.CharField(max_length=100)
     phone = models.CharField(max_length=15)
     nrc = models.CharField(max_length=50)
+    users = models.ManyToManyField(settings.AUTH_USER_MODEL, blank=True, related_name='depots')
+    capacity = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True,
+        help_text='Storage capacity in MT across all products; leave blank for no limit',
+    )
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"{self.name or 'NoName'} - {self.district or 'NoDistrict'}"
@@ -17,10 +26,45 @@ class Product(models.Model):
     name = models.CharField(max_length=100)
     price_per_bag = models.DecimalField(max_digits=10, decimal_places=2, default=1200.00)
     commission_per_bag = models.DecimalField(max_digits=10, decimal_places=2, default=50.00)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def price_on(self, day):
+        """Price and commission per bag in effect on a date.
+
+        Falls back to the product's own price before its first ProductPrice entry.
+        Uses prefetched prices when available so lists of stock don't query per row.
+        """
+        prefetched = getattr(self, '_prefetched_objects_cache', {}).get('prices')
+        if prefetched is not None:
+            current = max(
+                (price for price in prefetched if price.effective_from <= day),
+                key=lambda price: price.effective_from,
+                default=None,
+            )
+        else:
+            current = self.prices.filter(effective_from__lte=day).order_by('-effective_from').first()
+        if current is None:
+            return self.price_per_bag, self.commission_per_bag
+        return current.price_per_bag, current.commission_per_bag
     
     def __str__(self):
         return self.name or "NoProduct"
 
+class ProductPrice(models.Model):
+    """Price and commission per bag for a product from a given date onwards"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='prices')
+    effective_from = models.DateField()
+    price_per_bag = models.DecimalField(max_digits=10, decimal_places=2)
+    commission_per_bag = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ('product', 'effective_from')
+        ordering = ['product', '-effective_from']
+    
+    def __str__(self):
+        return f"{self.product} from {self.effective_from}: K{self.price_per_bag}"
+
 class Stock(models.Model):
     depot = models.ForeignKey(Depot, on_delete=models.CASCADE, null=True, blank=True)
     product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True)
@@ -66,7 +110,8 @@ class Stock(models.Model):
         if self.product and self.quantity:
             bags_per_mt = 20
             total_bags = self.quantity * bags_per_mt
-            monetary_value = total_bags * self.product.price_per_bag
+            price_per_bag, _ = self.product.price_on(date.today())
+            monetary_value = total_bags * price_per_bag
             return monetary_value
         return 0
     
@@ -81,9 +126,12 @@ class StockHistory(models.Model):
         ('sale', 'Stock Sale'),
         ('adjustment', 'Stock Adjustment'),
         ('correction', 'Stock Correction'),
+        ('transfer_out', 'Transfer Out'),
+        ('transfer_in', 'Transfer In'),
     ]
     
     stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='history')
+    transfer = models.ForeignKey('StockTransfer', on_delete=models.SET_NULL, null=True, blank=True, related_name='history')
     date = models.DateField()
     previous_quantity = models.DecimalField(max_digits=10, decimal_places=2)
     new_quantity = models.DecimalField(max_digits=10, decimal_places=2)
@@ -92,6 +140,7 @@ class StockHistory(models.Model):
     quantity_change = models.DecimalField(max_digits=10, decimal_places=2)  # Positive for addition, negative for reduction
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     class Meta:
         ordering = ['-date', '-created_at']
@@ -110,6 +159,22 @@ class StockHistory(models.Model):
         change_direction = "+" if self.quantity_change > 0 else ""
         return f"{self.date} - {self.stock} - {change_direction}{self.quantity_change}MT ({self.get_change_type_display()})"
 
+class StockTransfer(models.Model):
+    """Movement of stock between two depots, recorded as a pair of history entries"""
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    source_depot = models.ForeignKey(Depot, on_delete=models.CASCADE, related_name='transfers_out')
+    destination_depot = models.ForeignKey(Depot, on_delete=models.CASCADE, related_name='transfers_in')
+    quantity = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
+    notes = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-date', '-created_at']
+    
+    def __str__(self):
+        return f"{self.date} - {self.product} - {self.source_depot.name} to {self.destination_depot.name}: {self.quantity}MT"
+
 class DailySale(models.Model):
     date = models.DateField()
     depot = models.ForeignKey(Depot, on_delete=models.CASCADE, null=True, blank=True)
@@ -117,28 +182,78 @@ class DailySale(models.Model):
     bags_sold = models.IntegerField(validators=[MinValueValidator(0)])
     total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     commission_earned = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     class Meta:
         unique_together = ('date', 'depot', 'product')
     
+    def clean(self):
+        # New sales are checked by DailySaleForm; edits only need stock for the extra bags
+        if self.pk and self.depot_id and self.product_id and self.bags_sold is not None:
+            previous = DailySale.objects.filter(pk=self.pk).values('depot_id', 'product_id', 'bags_sold').first()
+            stock = Stock.objects.filter(depot_id=self.depot_id, product_id=self.product_id).first()
+            available = stock.get_available_bags() if stock else 0
+            if previous and (previous['depot_id'], previous['product_id']) == (self.depot_id, self.product_id):
+                available += previous['bags_sold']
+            if self.bags_sold > available:
+                raise ValidationError(
+                    f"Insufficient stock! Available: {available} bags, Trying to sell: {self.bags_sold} bags"
+                )
+    
     def save(self, *args, **kwargs):
         # Check if this is a new sale (not an update)
         is_new = self.pk is None
         
+        if not is_new:
+            from .sales import apply_sale_edit
+            with transaction.atomic():
+                # Lock the saved row so concurrent edits apply their stock deltas one after the other
+                previous = (
+                    DailySale.objects.select_for_update().filter(pk=self.pk)
+                    .values('depot_id', 'product_id', 'date', 'bags_sold').first()
+                )
+                if previous is not None:
+                    # Read by the post_save receivers that also need to update the old date
+                    self._previous_date = previous['date']
+                    self._set_amounts()
+                    super().save(*args, **kwargs)
+                    apply_sale_edit(previous, self)
+                    return
+        
         # Calculate amounts first
-        if self.product:
-            self.total_amount = Decimal(self.bags_sold) * self.product.price_per_bag
-            self.commission_earned = Decimal(self.bags_sold) * self.product.commission_per_bag
-        else:
-            self.total_amount = 0
-            self.commission_earned = 0
+        self._set_amounts()
         
         super().save(*args, **kwargs)
         
         # Reduce stock only for new sales
-        if is_new and self.depot and self.product and self.bags_sold > 0:
+        if self.depot and self.product and self.bags_sold > 0:
             self.reduce_stock()
     
+    def _set_amounts(self):
+        if self.product:
+            price_per_bag, commission_per_bag = self.product.price_on(self.date)
+            self.total_amount = Decimal(self.bags_sold) * price_per_bag
+            self.commission_earned = Decimal(self.bags_sold) * commission_per_bag
+        else:
+            self.total_amount = 0
+            self.commission_earned = 0
+    
+    def delete(self, *args, **kwargs):
+        # Put the sold bags back before the sale disappears
+        from .sales import adjust_stock_for_sale
+        with transaction.atomic():
+            # Restore what is saved, which may differ from a stale instance
+            saved = (
+                DailySale.objects.select_for_update().filter(pk=self.pk)
+                .values('depot_id', 'product_id', 'date', 'bags_sold').first()
+            )
+            if saved and saved['depot_id'] and saved['product_id'] and saved['bags_sold'] > 0:
+                adjust_stock_for_sale(
+                    saved['depot_id'], saved['product_id'], -saved['bags_sold'], saved['date'],
+                    f"Stock restored after sale of {saved['bags_sold']} bags on {saved['date']} was deleted",
+                )
+            return super().delete(*args, **kwargs)
+    
     def reduce_stock(self):
         """Reduce stock quantity based on bags sold - FIXED VERSION"""
         try:
@@ -175,7 +290,7 @@ class DailySale(models.Model):
                 error_msg = f"Insufficient stock! Available: {stock.get_available_bags()} bags, Trying to sell: {self.bags_sold} bags"
                 print(f"DEBUG: {error_msg}")
                 # Delete the sale since stock is insufficient
-                self.delete()
+                DailySale.objects.filter(pk=self.pk).delete()
                 raise Exception(error_msg)
                 
         except Stock.DoesNotExist:
@@ -183,7 +298,7 @@ class DailySale(models.Model):
             error_msg = f"No stock record found for {self.product} at {self.depot}"
             print(f"DEBUG: {error_msg}")
             # Delete the sale since no stock record exists
-            self.delete()
+            DailySale.objects.filter(pk=self.pk).delete()
             raise Exception(error_msg)
         except Exception as e:
             print(f"DEBUG: Error reducing stock: {e}")
@@ -205,6 +320,7 @@ class UCFPayment(models.Model):
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     description = models.TextField()
     reference_number = models.CharField(max_length=100, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     def __str__(self):
         return f"{self.date} - {self.payment_type} - K{self.amount}"
@@ -249,4 +365,64 @@ class DailyBalance(models.Model):
         super().save(*args, **kwargs)
     
     def __str__(self):
-        return f"Balance for {self.date}"
\ No newline at end of file
+        return f"Balance for {self.date}"
+
+class SearchDocument(models.Model):
+    """Denormalized text of searchable records, indexed by the database's full-text engine"""
+    KINDS = [
+        ('stock_history', 'Stock History'),
+        ('ucf_payment', 'UCF Payment'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KINDS)
+    object_id = models.BigIntegerField()
+    date = models.DateField()
+    content = models.TextField()
+
+    class Meta:
+        unique_together = ('kind', 'object_id')
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.object_id}"
+
+class SalesRollup(models.Model):
+    """Pre-aggregated sales per depot and product for a week, month or season"""
+    GRANULARITIES = [
+        ('week', 'Week'),
+        ('month', 'Month'),
+        ('season', 'Season'),
+    ]
+
+    granularity = models.CharField(max_length=10, choices=GRANULARITIES)
+    period_start = models.DateField()
+    depot = models.ForeignKey(Depot, on_delete=models.CASCADE, null=True, blank=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True)
+    bags_sold = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    commission_earned = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('granularity', 'period_start', 'depot', 'product')
+        indexes = [
+            models.Index(fields=['granularity', 'period_start']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_granularity_display()} {self.period_start} - {self.depot} - {self.product}"
+
+class SalesRollupPending(models.Model):
+    """Sale dates changed since the rollups were last refreshed"""
+    date = models.DateField(unique=True)
+
+    def __str__(self):
+        return str(self.date)
+
+class ExportWatermark(models.Model):
+    """How far the incremental analytics export has got, per table"""
+    table = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    last_updated_at = models.DateTimeField(null=True, blank=True)
+    exported_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.table} up to #{self.last_id}"
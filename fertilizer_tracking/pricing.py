@@ -0,0 +1,73 @@
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Q, Value
+from django.utils import timezone
+
+from . import live
+from .depots import invalidate_depots
+from .models import DailyBalance, DailySale, Product
+from .rollups import mark_dates_pending
+from .signals import publish_on_commit
+
+
+def _amount(per_bag, max_digits):
+    return ExpressionWrapper(
+        F('bags_sold') * Value(per_bag), output_field=DecimalField(max_digits=max_digits, decimal_places=2)
+    )
+
+
+def price_periods(product):
+    """(start, end, price_per_bag, commission_per_bag) for each price period, end exclusive.
+
+    The first period (before any ProductPrice entry) uses the product's own price.
+    """
+    prices = list(product.prices.order_by('effective_from'))
+    starts = [None] + [price.effective_from for price in prices]
+    ends = [price.effective_from for price in prices] + [None]
+    values = [(product.price_per_bag, product.commission_per_bag)] + [
+        (price.price_per_bag, price.commission_per_bag) for price in prices
+    ]
+    return [(start, end, price, commission) for start, end, (price, commission) in zip(starts, ends, values)]
+
+
+def reprice_sales(product=None, since=None):
+    """Recompute sale amounts from the prices in effect on each sale's date.
+
+    Each price period is one set-based UPDATE that only touches sales whose
+    amounts are actually wrong; the daily balances for the affected dates are
+    then recalculated. Returns (sales updated, dates touched).
+    """
+    products = [product] if product else list(Product.objects.all())
+    updated = 0
+    touched_dates = set()
+    touched_depots = set()
+
+    with transaction.atomic():
+        for item in products:
+            for start, end, price, commission in price_periods(item):
+                total_amount = _amount(price, 12)
+                commission_earned = _amount(commission, 10)
+                sales = DailySale.objects.filter(product=item)
+                if start:
+                    sales = sales.filter(date__gte=start)
+                if end:
+                    sales = sales.filter(date__lt=end)
+                if since:
+                    sales = sales.filter(date__gte=since)
+                sales = sales.filter(~Q(total_amount=total_amount) | ~Q(commission_earned=commission_earned))
+
+                for sale_date, depot_id in sales.values_list('date', 'depot_id').distinct():
+                    touched_dates.add(sale_date)
+                    touched_depots.add(depot_id)
+                updated += sales.update(
+                    total_amount=total_amount, commission_earned=commission_earned, updated_at=timezone.now(),
+                )
+
+        # update() skips DailySale signals, so refresh what depends on sale amounts here
+        for balance in DailyBalance.objects.filter(date__in=touched_dates):
+            balance.save()
+        mark_dates_pending(touched_dates)
+        invalidate_depots(touched_depots)
+        if updated:
+            publish_on_commit('sales_totals', live.sales_totals_event)
+
+    return updated, len(touched_dates)
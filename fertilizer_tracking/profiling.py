@@ -0,0 +1,153 @@
+"""Sampling SQL profiler.
+
+QueryProfilerMiddleware records every query run by a random sample of
+requests (SQL_PROFILER_SAMPLE_RATE) and keeps a summary of each sampled
+request in an in-memory ring buffer of SQL_PROFILER_BUFFER_SIZE entries.
+The buffer is per process, so each worker reports its own samples.
+
+Queries the async views send to their thread pool run on other threads'
+connections; those threads call record_queries() so the queries still count
+towards the sampled request.
+"""
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connections
+
+_samples = deque(maxlen=getattr(settings, 'SQL_PROFILER_BUFFER_SIZE', 500))
+_samples_lock = threading.Lock()
+_active_recorder = ContextVar('sql_profiler_recorder', default=None)
+
+# Slowest distinct queries kept per view in summarize_by_view()
+SLOWEST_PER_VIEW = 5
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+
+
+def fingerprint(sql):
+    """Normalize SQL so queries differing only in literal values compare equal"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql.replace('?', '%s'))
+    return ' '.join(sql.split())
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, (time.perf_counter() - start) * 1000))
+
+
+@contextmanager
+def record_queries():
+    """Record queries run on this thread into the sampled request that spawned it, if any"""
+    recorder = _active_recorder.get()
+    if recorder is None:
+        yield
+        return
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield
+
+
+def get_samples():
+    with _samples_lock:
+        return list(_samples)
+
+
+def clear_samples():
+    with _samples_lock:
+        _samples.clear()
+
+
+def summarize(request, response, recorder, total_ms):
+    fingerprints = Counter(fingerprint(sql) for sql, _ in recorder.queries)
+    slowest = sorted(recorder.queries, key=lambda query: query[1], reverse=True)[:5]
+    match = getattr(request, 'resolver_match', None)
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'method': request.method,
+        'path': request.path,
+        'view': match.view_name if match else '',
+        'status': response.status_code,
+        'total_ms': round(total_ms, 2),
+        'query_count': len(recorder.queries),
+        'db_ms': round(sum(duration for _, duration in recorder.queries), 2),
+        'duplicates': [
+            {'sql': sql, 'count': count}
+            for sql, count in fingerprints.most_common() if count > 1
+        ],
+        'slowest': [{'sql': sql, 'ms': round(duration, 2)} for sql, duration in slowest],
+    }
+
+
+def summarize_by_view(samples):
+    """Aggregate samples per view name, most expensive (by average DB time) first"""
+    views = {}
+    for sample in samples:
+        entry = views.setdefault(sample['view'] or sample['path'], {
+            'view': sample['view'] or sample['path'],
+            'requests': 0,
+            'queries': 0,
+            'max_queries': 0,
+            'db_ms': 0.0,
+            'duplicated': 0,
+            'slowest': [],
+        })
+        entry['requests'] += 1
+        entry['queries'] += sample['query_count']
+        entry['max_queries'] = max(entry['max_queries'], sample['query_count'])
+        entry['db_ms'] += sample['db_ms']
+        entry['duplicated'] += sum(d['count'] - 1 for d in sample['duplicates'])
+        entry['slowest'].extend(sample['slowest'])
+
+    for entry in views.values():
+        slowest = {}
+        for query in sorted(entry['slowest'], key=lambda query: query['ms'], reverse=True):
+            slowest.setdefault(fingerprint(query['sql']), query)
+        entry['slowest'] = list(slowest.values())[:SLOWEST_PER_VIEW]
+        entry['avg_queries'] = round(entry['queries'] / entry['requests'], 1)
+        entry['avg_db_ms'] = round(entry['db_ms'] / entry['requests'], 2)
+        entry['avg_duplicated'] = round(entry['duplicated'] / entry['requests'], 1)
+    return sorted(views.values(), key=lambda entry: entry['avg_db_ms'], reverse=True)
+
+
+class QueryProfilerMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'SQL_PROFILER_SAMPLE_RATE', 0.0)
+
+    def __call__(self, request):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        token = _active_recorder.set(recorder)
+        start = time.perf_counter()
+        try:
+            with record_queries():
+                response = self.get_response(request)
+        finally:
+            _active_recorder.reset(token)
+        total_ms = (time.perf_counter() - start) * 1000
+
+        sample = summarize(request, response, recorder, total_ms)
+        with _samples_lock:
+            _samples.append(sample)
+        return response
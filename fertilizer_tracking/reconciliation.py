@@ -0,0 +1,191 @@
+import csv
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+
+from .models import UCFPayment
+
+# Accepted header names for each statement column (compared case-insensitively)
+COLUMN_ALIASES = {
+    'date': ['date', 'value date', 'transaction date', 'posting date'],
+    'reference': ['reference', 'reference number', 'reference_number', 'ref', 'ref no'],
+    'amount': ['amount', 'value'],
+    'debit': ['debit', 'debit amount', 'withdrawal', 'withdrawals', 'paid out'],
+    'credit': ['credit', 'credit amount', 'deposit', 'deposits', 'paid in'],
+    'description': ['description', 'narrative', 'details', 'particulars'],
+}
+
+
+def normalize_reference(reference):
+    """Compare references ignoring case, spaces and punctuation"""
+    return ''.join(c for c in (reference or '').upper() if c.isalnum())
+
+
+def parse_amount(value):
+    cleaned = (value or '').replace(',', '').replace('K', '').replace('k', '').strip()
+    if cleaned.startswith('(') and cleaned.endswith(')'):
+        cleaned = cleaned[1:-1]
+    return abs(Decimal(cleaned)).quantize(Decimal('0.01'))
+
+
+def parse_date(value):
+    value = (value or '').strip()
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        day, month, year = value.replace('-', '/').split('/')
+        return date(int(year), int(month), int(day))
+
+
+def _resolve_columns(fieldnames):
+    lookup = {name.strip().lower(): name for name in fieldnames or []}
+    columns = {}
+    for column, aliases in COLUMN_ALIASES.items():
+        columns[column] = next((lookup[alias] for alias in aliases if alias in lookup), None)
+    missing = [column for column in ('date', 'amount') if columns[column] is None]
+    if columns['debit'] or columns['credit']:
+        # Statements with separate debit and credit columns take the amount from whichever is filled in
+        missing = [column for column in missing if column != 'amount']
+    if missing:
+        raise ValueError(f"Statement is missing required column(s): {', '.join(missing)}")
+    return columns
+
+
+def _line_amount(row, columns):
+    if columns['amount']:
+        return parse_amount(row[columns['amount']])
+    amounts = [
+        parse_amount(row[columns[column]])
+        for column in ('debit', 'credit')
+        if columns[column] and (row[columns[column]] or '').strip()
+    ]
+    amounts = [amount for amount in amounts if amount]
+    if len(amounts) != 1:
+        raise ValueError('Expected an amount in exactly one of the debit and credit columns')
+    return amounts[0]
+
+
+def parse_statement(stream):
+    """Yield statement lines one at a time from a CSV text stream.
+
+    Lines that can't be parsed are yielded with an 'error' so they show up in
+    the report rather than silently disappearing.
+    """
+    reader = csv.DictReader(stream)
+    columns = _resolve_columns(reader.fieldnames)
+    for line_number, row in enumerate(reader, start=2):
+        line = {
+            'line_number': line_number,
+            'reference': (row.get(columns['reference']) or '').strip() if columns['reference'] else '',
+            'description': (row.get(columns['description']) or '').strip() if columns['description'] else '',
+            'error': None,
+        }
+        try:
+            line['date'] = parse_date(row[columns['date']])
+            line['amount'] = _line_amount(row, columns)
+        except (ValueError, InvalidOperation, TypeError):
+            line['date'] = None
+            line['amount'] = None
+            line['error'] = 'Could not read date or amount'
+        yield line
+
+
+class ReconciliationResult:
+    def __init__(self):
+        self.matched = []
+        self.unmatched = []
+        self.ambiguous = []
+        self.unmatched_payments = []
+
+    @property
+    def lines_processed(self):
+        return len(self.matched) + len(self.unmatched) + len(self.ambiguous)
+
+
+class Reconciler:
+    """Match statement lines to UCFPayment rows using in-memory hash indexes.
+
+    Payments are indexed once by normalized reference and by (amount, date), so
+    each statement line costs a handful of dictionary lookups (one per day of
+    tolerance) instead of a scan over every payment.
+    """
+
+    def __init__(self, payments=None, tolerance_days=3):
+        self.tolerance_days = tolerance_days
+        self.payments = {}
+        self.by_reference = {}
+        self.by_amount_date = {}
+        self.consumed = set()
+
+        if payments is None:
+            payments = UCFPayment.objects.values_list(
+                'id', 'date', 'amount', 'reference_number', 'payment_type'
+            ).iterator(chunk_size=2000)
+        for payment_id, payment_date, amount, reference, payment_type in payments:
+            self.payments[payment_id] = {
+                'id': payment_id,
+                'date': payment_date,
+                'amount': amount,
+                'reference_number': reference,
+                'payment_type': payment_type,
+            }
+            key = normalize_reference(reference)
+            if key:
+                self.by_reference.setdefault(key, []).append(payment_id)
+            self.by_amount_date.setdefault((amount, payment_date), []).append(payment_id)
+
+    def _available(self, payment_ids):
+        return [payment_id for payment_id in payment_ids if payment_id not in self.consumed]
+
+    def match_line(self, line):
+        """Classify one statement line as 'matched', 'ambiguous' or 'unmatched'"""
+        if line['error']:
+            return 'unmatched', [], line['error']
+
+        reference = normalize_reference(line['reference'])
+        if reference:
+            candidates = self._available(self.by_reference.get(reference, []))
+            same_amount = [pid for pid in candidates if self.payments[pid]['amount'] == line['amount']]
+            if len(same_amount) == 1:
+                return 'matched', same_amount, 'Reference and amount'
+            if len(same_amount) > 1:
+                return 'ambiguous', same_amount, 'Reference shared by several payments'
+            if candidates:
+                return 'ambiguous', candidates, 'Reference matches but amount differs'
+
+        candidates = []
+        for offset in range(-self.tolerance_days, self.tolerance_days + 1):
+            key = (line['amount'], line['date'] + timedelta(days=offset))
+            candidates.extend(self._available(self.by_amount_date.get(key, [])))
+        if len(candidates) == 1:
+            return 'matched', candidates, 'Amount and date'
+        if len(candidates) > 1:
+            return 'ambiguous', candidates, f"{len(candidates)} payments with this amount within {self.tolerance_days} days"
+        return 'unmatched', [], 'No payment found'
+
+    def reconcile(self, lines):
+        result = ReconciliationResult()
+        for line in lines:
+            status, payment_ids, reason = self.match_line(line)
+            item = {
+                'line': line,
+                'payments': [self.payments[pid] for pid in payment_ids],
+                'reason': reason,
+            }
+            if status == 'matched':
+                self.consumed.add(payment_ids[0])
+                result.matched.append(item)
+            elif status == 'ambiguous':
+                result.ambiguous.append(item)
+            else:
+                result.unmatched.append(item)
+
+        result.unmatched_payments = [
+            payment for payment_id, payment in self.payments.items()
+            if payment_id not in self.consumed
+        ]
+        return result
+
+
+def reconcile_statement(stream, tolerance_days=3):
+    """Reconcile a CSV statement stream against every recorded UCF payment"""
+    return Reconciler(tolerance_days=tolerance_days).reconcile(parse_statement(stream))
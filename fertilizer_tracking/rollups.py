@@ -0,0 +1,228 @@
+"""Weekly, monthly and seasonal sales rollups and the chart series built from them.
+
+Sale saves and deletes only record the affected date in SalesRollupPending.
+refresh_rollups() then recomputes just the weeks, months and seasons that
+contain those dates, so keeping the rollups current never rescans the whole
+DailySale table. It runs once the writing transaction commits, and the
+refresh_sales_rollups command picks up anything a failed refresh left behind;
+reading the charts never writes.
+"""
+import math
+from datetime import date, timedelta
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+from .models import DailySale, SalesRollup, SalesRollupPending
+
+# Spans (in days) up to which each granularity is used for charts; anything longer uses seasons
+WEEK_CHART_MAX_DAYS = 182
+MONTH_CHART_MAX_DAYS = 3 * 366
+
+
+def season_start_month():
+    # The farming season runs from October to September unless configured otherwise
+    return getattr(settings, 'SALES_SEASON_START_MONTH', 10)
+
+
+def period_start(granularity, day):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    start_month = season_start_month()
+    year = day.year if day.month >= start_month else day.year - 1
+    return date(year, start_month, 1)
+
+
+def period_end(granularity, start):
+    """Last day of the period beginning on start"""
+    if granularity == 'week':
+        return start + timedelta(days=6)
+    if granularity == 'month':
+        next_month = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+        return next_month - timedelta(days=1)
+    return date(start.year + 1, start.month, 1) - timedelta(days=1)
+
+
+def season_label(start):
+    return f"{start.year}/{str(start.year + 1)[-2:]}"
+
+
+def mark_dates_pending(dates):
+    dates = set(dates)
+    if not dates:
+        return
+    SalesRollupPending.objects.bulk_create(
+        [SalesRollupPending(date=d) for d in dates], ignore_conflicts=True
+    )
+    # Later callbacks in the same transaction find nothing pending and return at once
+    transaction.on_commit(refresh_rollups, robust=True)
+
+
+def _period_filter(granularity, starts):
+    return reduce(or_, (Q(date__range=[start, period_end(granularity, start)]) for start in starts))
+
+
+def _rollups_from_sales(granularity, starts):
+    """Aggregate raw sales into rollup rows for the given weeks or months in one query"""
+    trunc = TruncWeek if granularity == 'week' else TruncMonth
+    sales = DailySale.objects.all()
+    if starts is not None:
+        sales = sales.filter(_period_filter(granularity, starts))
+    rows = (
+        sales
+        .annotate(period=trunc('date'))
+        .values('period', 'depot_id', 'product_id')
+        .annotate(bags=Sum('bags_sold'), amount=Sum('total_amount'), commission=Sum('commission_earned'))
+    )
+    return [
+        SalesRollup(
+            granularity=granularity,
+            period_start=row['period'],
+            depot_id=row['depot_id'],
+            product_id=row['product_id'],
+            bags_sold=row['bags'] or 0,
+            total_amount=row['amount'] or 0,
+            commission_earned=row['commission'] or 0,
+        )
+        for row in rows
+    ]
+
+
+def _season_rollups_from_months(starts):
+    """Seasons are the sum of their monthly rollups, so they never touch raw sales"""
+    months = SalesRollup.objects.filter(granularity='month')
+    if starts is not None:
+        months = months.filter(
+            reduce(or_, (Q(period_start__range=[start, period_end('season', start)]) for start in starts))
+        )
+
+    totals = {}
+    for month, depot_id, product_id, bags, amount, commission in months.values_list(
+        'period_start', 'depot_id', 'product_id', 'bags_sold', 'total_amount', 'commission_earned'
+    ):
+        key = (period_start('season', month), depot_id, product_id)
+        entry = totals.setdefault(key, [0, Decimal('0'), Decimal('0')])
+        entry[0] += bags
+        entry[1] += amount
+        entry[2] += commission
+
+    return [
+        SalesRollup(
+            granularity='season', period_start=start, depot_id=depot_id, product_id=product_id,
+            bags_sold=bags, total_amount=amount, commission_earned=commission,
+        )
+        for (start, depot_id, product_id), (bags, amount, commission) in totals.items()
+    ]
+
+
+def _replace_rollups(granularity, starts, rollups):
+    existing = SalesRollup.objects.filter(granularity=granularity)
+    if starts is not None:
+        existing = existing.filter(period_start__in=starts)
+    existing.delete()
+    # A concurrent refresh may have inserted the same periods since the delete, so upsert
+    SalesRollup.objects.bulk_create(
+        rollups,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['granularity', 'period_start', 'depot', 'product'],
+        update_fields=['bags_sold', 'total_amount', 'commission_earned'],
+    )
+
+
+def refresh_rollups(full=False):
+    """Recompute rollups for pending dates (or everything), returning the number of dates processed"""
+    with transaction.atomic():
+        pending = list(SalesRollupPending.objects.values_list('id', 'date'))
+        if not pending and not full:
+            return 0
+
+        if full:
+            weeks = months = seasons = None
+        else:
+            dates = {d for _, d in pending}
+            weeks = {period_start('week', d) for d in dates}
+            months = {period_start('month', d) for d in dates}
+            seasons = {period_start('season', d) for d in dates}
+
+        _replace_rollups('week', weeks, _rollups_from_sales('week', weeks))
+        _replace_rollups('month', months, _rollups_from_sales('month', months))
+        _replace_rollups('season', seasons, _season_rollups_from_months(seasons))
+
+        SalesRollupPending.objects.filter(id__in=[pk for pk, _ in pending]).delete()
+    return len(pending)
+
+
+def choose_granularity(start_date, end_date):
+    span = (end_date - start_date).days
+    if span <= WEEK_CHART_MAX_DAYS:
+        return 'week'
+    if span <= MONTH_CHART_MAX_DAYS:
+        return 'month'
+    return 'season'
+
+
+def _downsample(labels, values, max_points):
+    """Merge neighbouring periods so a series has at most max_points points"""
+    if len(labels) <= max_points:
+        return labels, values
+    size = math.ceil(len(labels) / max_points)
+    merged_labels = labels[::size]
+    merged_values = {
+        name: [sum(points[i:i + size]) for i in range(0, len(points), size)]
+        for name, points in values.items()
+    }
+    return merged_labels, merged_values
+
+
+def sales_chart(start_date, end_date, group_by=None, depot_id=None, product_id=None, max_points=60):
+    """Build chart series of bags and revenue between two dates from the rollup tables"""
+    granularity = choose_granularity(start_date, end_date)
+    first = period_start(granularity, start_date)
+    last = period_start(granularity, end_date)
+
+    rollups = SalesRollup.objects.filter(granularity=granularity, period_start__range=[first, last])
+    if depot_id:
+        rollups = rollups.filter(depot_id=depot_id)
+    if product_id:
+        rollups = rollups.filter(product_id=product_id)
+
+    group_field = {'depot': 'depot__name', 'product': 'product__name'}.get(group_by)
+    fields = ['period_start'] + ([group_field] if group_field else [])
+    rows = rollups.values(*fields).annotate(bags=Sum('bags_sold'), revenue=Sum('total_amount')).order_by(*fields)
+
+    periods = []
+    current = first
+    while current <= last:
+        periods.append(current)
+        current = period_start(granularity, period_end(granularity, current) + timedelta(days=1))
+    index = {start: i for i, start in enumerate(periods)}
+
+    bags = {}
+    revenue = {}
+    for row in rows:
+        name = (row[group_field] or 'Unknown') if group_field else 'Total'
+        bags.setdefault(name, [0] * len(periods))[index[row['period_start']]] += row['bags'] or 0
+        revenue.setdefault(name, [Decimal('0')] * len(periods))[index[row['period_start']]] += row['revenue'] or 0
+
+    labels = [season_label(start) if granularity == 'season' else start.isoformat() for start in periods]
+    sampled_labels, bags = _downsample(labels, bags, max_points)
+    _, revenue = _downsample(labels, revenue, max_points)
+
+    return {
+        'granularity': granularity,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'labels': sampled_labels,
+        'series': [
+            {'name': name, 'bags': bags[name], 'revenue': [float(value) for value in revenue[name]]}
+            for name in sorted(bags)
+        ],
+    }
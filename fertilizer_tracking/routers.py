@@ -0,0 +1,93 @@
+"""Read-replica routing for reporting pages.
+
+ReplicaRoutingMiddleware marks GET requests to the reporting views and the
+admin changelists, and ReplicaRouter sends their reads to the
+REPLICA_DATABASE alias. Writes always go to the primary. A request that
+writes sets a short-lived cookie, and for REPLICA_STICKY_SECONDS after it
+that client reads from the primary too, so clerks see their own sales in
+reports even when the replica lags behind.
+
+Only this app's models are read from the replica; sessions, auth and the
+other contrib apps always use the primary. Nothing is routed unless the
+replica alias is configured in DATABASES.
+Locally the replica can be a SQLite copy refreshed with the
+refresh_replica command.
+"""
+from contextvars import ContextVar
+
+from django.conf import settings
+
+REPLICA_VIEW_NAMES = {
+    'sales_report',
+    'download_sales_report',
+    'ucf_balance',
+    'ucf_balance_async',
+    'stock_history',
+    'stock_history_detail',
+}
+STICKY_COOKIE = 'use_primary_db'
+
+_use_replica = ContextVar('use_replica', default=False)
+_wrote = ContextVar('wrote', default=None)
+
+
+def replica_alias():
+    alias = getattr(settings, 'REPLICA_DATABASE', 'replica')
+    return alias if alias in settings.DATABASES else None
+
+
+def is_replica_view(resolver_match):
+    if resolver_match.url_name in REPLICA_VIEW_NAMES:
+        return True
+    return resolver_match.namespace == 'admin' and (resolver_match.url_name or '').endswith('_changelist')
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and model._meta.app_label == 'fertilizer_tracking':
+            return replica_alias()
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        wrote = _wrote.get()
+        if wrote is not None:
+            wrote[0] = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica is a copy of the primary, so objects from either can be related
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        return db != replica_alias()
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sticky_seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 90)
+
+    def __call__(self, request):
+        wrote = [False]
+        wrote_token = _wrote.set(wrote)
+        replica_token = _use_replica.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_replica.reset(replica_token)
+            _wrote.reset(wrote_token)
+
+        if wrote[0] and self.sticky_seconds > 0:
+            response.set_cookie(STICKY_COOKIE, '1', max_age=self.sticky_seconds, httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            request.method in ('GET', 'HEAD')
+            and replica_alias()
+            and not request.COOKIES.get(STICKY_COOKIE)
+            and is_replica_view(request.resolver_match)
+        ):
+            _use_replica.set(True)
+        return None
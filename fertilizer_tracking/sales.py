@@ -0,0 +1,133 @@
+"""Keep stock in step when recorded sales are edited or deleted.
+
+A new sale takes its bags out of stock in DailySale.reduce_stock(). Later
+edits and deletions are applied as deltas: a single F-expression update of
+the stock row plus a 'sale' history entry carrying the signed change in
+bags, so the sale history for each day still adds up to the sales recorded
+for that day.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from . import live
+from .history import bulk_create_history
+from .models import Stock, StockHistory
+from .signals import publish_on_commit
+
+BAGS_PER_MT = 20
+
+
+class StockAdjustmentError(Exception):
+    pass
+
+
+def _apply_change(depot_id, product_id, change):
+    """Add change MT to a stock record with one UPDATE, returning the updated record"""
+    stocks = Stock.objects.filter(depot_id=depot_id, product_id=product_id)
+    if change < 0:
+        stocks = stocks.filter(quantity__gte=-change)
+    else:
+        # Sales being undone may belong to a stock record that was since removed
+        Stock.objects.get_or_create(depot_id=depot_id, product_id=product_id, defaults={'quantity': 0})
+
+    if not stocks.update(quantity=F('quantity') + change, date_updated=timezone.now()):
+        stock = Stock.objects.filter(depot_id=depot_id, product_id=product_id).first()
+        if stock is None:
+            raise StockAdjustmentError(f"No stock record found for product {product_id} at depot {depot_id}")
+        raise StockAdjustmentError(
+            f"Insufficient stock! Available: {stock.get_available_bags()} bags, "
+            f"Trying to sell: {int(-change * BAGS_PER_MT)} more bags"
+        )
+
+    stock = Stock.objects.select_related('depot', 'product').get(depot_id=depot_id, product_id=product_id)
+    # update() skips post_save, so push the dashboard update here
+    publish_on_commit('stock', live.stock_event, stock)
+    return stock
+
+
+def adjust_stock_for_sale(depot_id, product_id, bags, sale_date, description):
+    """Take bags out of stock for a sale, or put them back when bags is negative"""
+    if not bags:
+        return None
+    change = -Decimal(bags) / Decimal(BAGS_PER_MT)
+    with transaction.atomic():
+        stock = _apply_change(depot_id, product_id, change)
+        return StockHistory.objects.create(
+            stock=stock,
+            date=sale_date,
+            previous_quantity=stock.quantity - change,
+            new_quantity=stock.quantity,
+            change_type='sale',
+            bags_sold=bags,
+            description=description,
+        )
+
+
+def apply_sale_edit(previous, sale):
+    """Adjust stock for an edited sale, given its previously saved values.
+
+    previous is a dict of the sale's depot_id, product_id, date and bags_sold
+    as they were in the database before the edit.
+    """
+    old_key = (previous['depot_id'], previous['product_id'], previous['date'])
+    new_key = (sale.depot_id, sale.product_id, sale.date)
+    old_bags = previous['bags_sold'] if all(old_key[:2]) else 0
+    new_bags = sale.bags_sold if all(new_key[:2]) else 0
+
+    with transaction.atomic():
+        if old_key == new_key:
+            adjust_stock_for_sale(
+                sale.depot_id, sale.product_id, new_bags - old_bags, sale.date,
+                f"Sale on {sale.date} changed from {old_bags} to {new_bags} bags",
+            )
+            return
+        # Moving a sale to another depot, product or day undoes it there and applies it here
+        adjust_stock_for_sale(
+            previous['depot_id'], previous['product_id'], -old_bags, previous['date'],
+            f"Stock restored after sale of {old_bags} bags on {previous['date']} was moved",
+        )
+        adjust_stock_for_sale(
+            sale.depot_id, sale.product_id, new_bags, sale.date,
+            f"Stock reduced due to sale of {new_bags} bags on {sale.date}",
+        )
+
+
+def restore_stock_for_sales(sales):
+    """Put back the stock taken by a queryset of sales that is about to be deleted.
+
+    Each depot and product gets one stock update for the total bags. The
+    history keeps one entry per day, written in a single insert, so it still
+    matches the remaining sales day by day.
+    """
+    rows = (
+        sales.filter(depot__isnull=False, product__isnull=False, bags_sold__gt=0)
+        .values('depot_id', 'product_id', 'date').annotate(bags=Sum('bags_sold'))
+        .order_by('depot_id', 'product_id', 'date')
+    )
+    days_by_pair = defaultdict(list)
+    for row in rows:
+        days_by_pair[(row['depot_id'], row['product_id'])].append((row['date'], row['bags']))
+
+    with transaction.atomic():
+        history = []
+        for (depot_id, product_id), days in days_by_pair.items():
+            total = Decimal(sum(bags for _, bags in days)) / Decimal(BAGS_PER_MT)
+            stock = _apply_change(depot_id, product_id, total)
+            running = stock.quantity - total
+            for day, bags in days:
+                change = Decimal(bags) / Decimal(BAGS_PER_MT)
+                history.append(StockHistory(
+                    stock=stock,
+                    date=day,
+                    previous_quantity=running,
+                    new_quantity=running + change,
+                    change_type='sale',
+                    bags_sold=-bags,
+                    description=f"Stock restored after sales of {bags} bags on {day} were deleted",
+                ))
+                running += change
+        return bulk_create_history(history)
@@ -0,0 +1,188 @@
+import re
+
+from django.db import connection
+
+from .models import SearchDocument, StockHistory, UCFPayment
+
+FTS_TABLE = 'fertilizer_tracking_searchdocument_fts'
+
+SEARCH_MODELS = {
+    'stock_history': StockHistory,
+    'ucf_payment': UCFPayment,
+}
+
+
+def document_content(kind, obj):
+    """Text that gets indexed for a record"""
+    if kind == 'ucf_payment':
+        return f"{obj.reference_number} {obj.description}".strip()
+    return obj.description or ''
+
+
+def index_object(kind, obj):
+    """Create or refresh the search document for a record"""
+    SearchDocument.objects.update_or_create(
+        kind=kind,
+        object_id=obj.pk,
+        defaults={'date': obj.date, 'content': document_content(kind, obj)},
+    )
+
+
+def index_objects(kind, objs):
+    """Index records created in bulk, which bypasses the post_save signal"""
+    SearchDocument.objects.bulk_create([
+        SearchDocument(kind=kind, object_id=obj.pk, date=obj.date, content=document_content(kind, obj))
+        for obj in objs
+    ], update_conflicts=True, unique_fields=['kind', 'object_id'], update_fields=['date', 'content'])
+
+
+def unindex_object(kind, object_id):
+    SearchDocument.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def rebuild_index(batch_size=1000):
+    """Rebuild every search document from scratch, returning the number indexed"""
+    SearchDocument.objects.all().delete()
+    total = 0
+    for kind, model in SEARCH_MODELS.items():
+        batch = []
+        for obj in model.objects.order_by('pk').iterator(chunk_size=batch_size):
+            batch.append(SearchDocument(
+                kind=kind, object_id=obj.pk, date=obj.date, content=document_content(kind, obj),
+            ))
+            if len(batch) >= batch_size:
+                SearchDocument.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        SearchDocument.objects.bulk_create(batch)
+        total += len(batch)
+    return total
+
+
+def _fts5_query(query):
+    """Turn free text into an FTS5 query matching every word as a prefix"""
+    terms = re.findall(r'\w+', query)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+class SearchResults:
+    """Lazily ranked search results that can be handed straight to a Paginator.
+
+    Only the requested page is fetched from the database, and the matching
+    records for that page are loaded with one query per record type.
+    """
+
+    def __init__(self, query, kind=None):
+        self.query = query.strip()
+        self.kind = kind if kind in SEARCH_MODELS else None
+        self._count = None
+
+    def _filters(self):
+        if self.kind:
+            return ' AND d.kind = %s', [self.kind]
+        return '', []
+
+    def count(self):
+        if self._count is None:
+            self._count = self._run_count()
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        start = item.start or 0
+        stop = item.stop if item.stop is not None else self.count()
+        if stop <= start:
+            return []
+        return self._hydrate(self._run_page(start, stop - start))
+
+    def _run_count(self):
+        if not self.query:
+            return 0
+        kind_sql, kind_params = self._filters()
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                match = _fts5_query(self.query)
+                if not match:
+                    return 0
+                cursor.execute(
+                    f"SELECT COUNT(*) FROM {FTS_TABLE} f "
+                    f"JOIN fertilizer_tracking_searchdocument d ON d.id = f.rowid "
+                    f"WHERE {FTS_TABLE} MATCH %s{kind_sql}",
+                    [match] + kind_params,
+                )
+                return cursor.fetchone()[0]
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT COUNT(*) FROM fertilizer_tracking_searchdocument d "
+                    f"WHERE to_tsvector('english', d.content) @@ plainto_tsquery('english', %s){kind_sql}",
+                    [self.query] + kind_params,
+                )
+                return cursor.fetchone()[0]
+        return self._fallback_queryset().count()
+
+    def _run_page(self, offset, limit):
+        """Return (kind, object_id, snippet) rows for one page, best match first"""
+        if not self.query:
+            return []
+        kind_sql, kind_params = self._filters()
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                match = _fts5_query(self.query)
+                if not match:
+                    return []
+                cursor.execute(
+                    f"SELECT d.kind, d.object_id, snippet({FTS_TABLE}, 0, '[', ']', '...', 12) "
+                    f"FROM {FTS_TABLE} f "
+                    f"JOIN fertilizer_tracking_searchdocument d ON d.id = f.rowid "
+                    f"WHERE {FTS_TABLE} MATCH %s{kind_sql} "
+                    f"ORDER BY bm25({FTS_TABLE}), d.date DESC LIMIT %s OFFSET %s",
+                    [match] + kind_params + [limit, offset],
+                )
+                return cursor.fetchall()
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT d.kind, d.object_id, "
+                    "ts_headline('english', d.content, q, 'StartSel=[,StopSel=],MaxWords=20') "
+                    "FROM fertilizer_tracking_searchdocument d, plainto_tsquery('english', %s) q "
+                    f"WHERE to_tsvector('english', d.content) @@ q{kind_sql} "
+                    "ORDER BY ts_rank(to_tsvector('english', d.content), q) DESC, d.date DESC "
+                    "LIMIT %s OFFSET %s",
+                    [self.query] + kind_params + [limit, offset],
+                )
+                return cursor.fetchall()
+        return [
+            (doc.kind, doc.object_id, doc.content)
+            for doc in self._fallback_queryset().order_by('-date', '-id')[offset:offset + limit]
+        ]
+
+    def _fallback_queryset(self):
+        documents = SearchDocument.objects.all()
+        for term in self.query.split():
+            documents = documents.filter(content__icontains=term)
+        if self.kind:
+            documents = documents.filter(kind=self.kind)
+        return documents
+
+    def _hydrate(self, rows):
+        ids_by_kind = {}
+        for kind, object_id, snippet in rows:
+            ids_by_kind.setdefault(kind, []).append(object_id)
+
+        objects = {}
+        if 'stock_history' in ids_by_kind:
+            objects['stock_history'] = StockHistory.objects.select_related(
+                'stock', 'stock__depot', 'stock__product'
+            ).in_bulk(ids_by_kind['stock_history'])
+        if 'ucf_payment' in ids_by_kind:
+            objects['ucf_payment'] = UCFPayment.objects.in_bulk(ids_by_kind['ucf_payment'])
+
+        results = []
+        for kind, object_id, snippet in rows:
+            obj = objects.get(kind, {}).get(object_id)
+            if obj is not None:
+                results.append({'kind': kind, 'object': obj, 'snippet': snippet})
+        return results
@@ -0,0 +1,72 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import live
+from .depots import invalidate_all_depots, invalidate_depots
+from .models import DailySale, Product, ProductPrice, Stock, StockHistory, UCFPayment
+from .rollups import mark_dates_pending
+from .search import index_object, unindex_object
+
+
+def publish_on_commit(event_type, build_event, *args):
+    """Publish a live update once the surrounding transaction commits"""
+    def publish():
+        live.get_broker().publish(event_type, build_event(*args))
+    transaction.on_commit(publish, robust=True)
+
+
+@receiver(post_save, sender=StockHistory)
+def index_stock_history(sender, instance, **kwargs):
+    index_object('stock_history', instance)
+    publish_on_commit('stock_history', live.stock_history_event, instance)
+
+
+@receiver(post_delete, sender=StockHistory)
+def unindex_stock_history(sender, instance, **kwargs):
+    unindex_object('stock_history', instance.pk)
+
+
+@receiver(post_save, sender=UCFPayment)
+def index_ucf_payment(sender, instance, **kwargs):
+    index_object('ucf_payment', instance)
+    publish_on_commit('payment', live.payment_event, instance)
+
+
+@receiver(post_delete, sender=UCFPayment)
+def unindex_ucf_payment(sender, instance, **kwargs):
+    unindex_object('ucf_payment', instance.pk)
+
+
+@receiver(post_save, sender=Stock)
+def stock_changed(sender, instance, **kwargs):
+    publish_on_commit('stock', live.stock_event, instance)
+
+
+@receiver([post_save, post_delete], sender=DailySale)
+def sales_changed(sender, instance, **kwargs):
+    dates = [instance.date]
+    # A sale moved to another day also changes the rollups of the day it left
+    if getattr(instance, '_previous_date', None):
+        dates.append(instance._previous_date)
+    mark_dates_pending(dates)
+    publish_on_commit('sales_totals', live.sales_totals_event)
+
+
+@receiver([post_save, post_delete], sender=Stock)
+@receiver([post_save, post_delete], sender=DailySale)
+def depot_data_changed(sender, instance, **kwargs):
+    invalidate_depots([instance.depot_id])
+
+
+@receiver([post_save, post_delete], sender=StockHistory)
+def depot_history_changed(sender, instance, **kwargs):
+    depot_id = Stock.objects.filter(pk=instance.stock_id).values_list('depot_id', flat=True).first()
+    invalidate_depots([depot_id])
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductPrice)
+def prices_changed(sender, instance, **kwargs):
+    # Stock values at every depot depend on the product's price
+    invalidate_all_depots()
@@ -0,0 +1,200 @@
+import calendar
+import csv
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from decimal import Decimal
+
+from django.db.models import Sum
+
+from .models import DailySale
+
+STATEMENT_FORMATS = ('txt', 'csv', 'pdf')
+
+
+def month_bounds(year, month):
+    """Return the first and last day of the given month"""
+    last_day = calendar.monthrange(year, month)[1]
+    return date(year, month, 1), date(year, month, last_day)
+
+
+def parse_month(value):
+    """Parse a 'YYYY-MM' string into a (year, month) tuple, defaulting to this month"""
+    if not value:
+        today = date.today()
+        return today.year, today.month
+    year, month = value.split('-')
+    return int(year), int(month)
+
+
+def build_commission_statements(year, month):
+    """Build per-depot commission statements for a month from a single grouped query.
+
+    Returns a list of plain dicts (one per depot with sales in the month) so the
+    statements can be handed to worker processes without touching the ORM there.
+    """
+    start_date, end_date = month_bounds(year, month)
+
+    rows = (
+        DailySale.objects
+        .filter(date__range=[start_date, end_date], depot__isnull=False)
+        .values('depot_id', 'depot__name', 'depot__district', 'depot__manager', 'product__name')
+        .annotate(
+            bags=Sum('bags_sold'),
+            sales=Sum('total_amount'),
+            commission=Sum('commission_earned'),
+        )
+        .order_by('depot__name', 'depot_id', 'product__name')
+    )
+
+    statements = {}
+    for row in rows:
+        statement = statements.get(row['depot_id'])
+        if statement is None:
+            statement = statements[row['depot_id']] = {
+                'depot_id': row['depot_id'],
+                'depot_name': row['depot__name'] or 'NoDepot',
+                'district': row['depot__district'] or '',
+                'manager': row['depot__manager'] or '',
+                'start_date': start_date,
+                'end_date': end_date,
+                'lines': [],
+                'total_bags': 0,
+                'total_sales': Decimal('0'),
+                'total_commission': Decimal('0'),
+            }
+        statement['lines'].append({
+            'product': row['product__name'] or 'NoProduct',
+            'bags': row['bags'] or 0,
+            'sales': row['sales'] or Decimal('0'),
+            'commission': row['commission'] or Decimal('0'),
+        })
+        statement['total_bags'] += row['bags'] or 0
+        statement['total_sales'] += row['sales'] or Decimal('0')
+        statement['total_commission'] += row['commission'] or Decimal('0')
+
+    return list(statements.values())
+
+
+def statement_filename(statement, fmt):
+    """File name for a depot's statement document"""
+    period = statement['start_date'].strftime('%Y_%m')
+    depot_name = ''.join(c if c.isalnum() else '_' for c in statement['depot_name'])
+    return f"commission_{depot_name}_{statement['depot_id']}_{period}.{fmt}"
+
+
+def render_statement_text(statement):
+    lines = []
+    lines.append(f"CMM Chronos Ltd - Commission Statement ({statement['start_date']} to {statement['end_date']})")
+    lines.append("=" * 60)
+    lines.append(f"Depot: {statement['depot_name']} - {statement['district']}")
+    lines.append(f"Manager: {statement['manager']}")
+    lines.append("-" * 60)
+    lines.append(f"{'Product':<20} {'Bags':<8} {'Sales':<15} {'Commission':<15}")
+    lines.append("-" * 60)
+    for line in statement['lines']:
+        lines.append(f"{line['product']:<20} {line['bags']:<8} K{line['sales']:<14.2f} K{line['commission']:<14.2f}")
+    lines.append("-" * 60)
+    lines.append(f"{'TOTAL':<20} {statement['total_bags']:<8} K{statement['total_sales']:<14.2f} K{statement['total_commission']:<14.2f}")
+    return "\n".join(lines).encode('utf-8')
+
+
+def render_statement_csv(statement):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['Depot', 'Period Start', 'Period End', 'Product', 'Bags', 'Sales', 'Commission'])
+    for line in statement['lines']:
+        writer.writerow([
+            statement['depot_name'], statement['start_date'], statement['end_date'],
+            line['product'], line['bags'], f"{line['sales']:.2f}", f"{line['commission']:.2f}",
+        ])
+    writer.writerow([
+        statement['depot_name'], statement['start_date'], statement['end_date'],
+        'TOTAL', statement['total_bags'], f"{statement['total_sales']:.2f}", f"{statement['total_commission']:.2f}",
+    ])
+    return buffer.getvalue().encode('utf-8')
+
+
+def render_statement_pdf(statement):
+    # reportlab is only needed for PDF output, so import it lazily
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    y = height - 50
+
+    pdf.setFont('Helvetica-Bold', 14)
+    pdf.drawString(40, y, "CMM Chronos Ltd - Commission Statement")
+    y -= 20
+    pdf.setFont('Helvetica', 10)
+    pdf.drawString(40, y, f"Period: {statement['start_date']} to {statement['end_date']}")
+    y -= 15
+    pdf.drawString(40, y, f"Depot: {statement['depot_name']} - {statement['district']}")
+    y -= 15
+    pdf.drawString(40, y, f"Manager: {statement['manager']}")
+    y -= 30
+
+    columns = [40, 220, 300, 420]
+    pdf.setFont('Helvetica-Bold', 10)
+    for x, heading in zip(columns, ['Product', 'Bags', 'Sales', 'Commission']):
+        pdf.drawString(x, y, heading)
+    y -= 15
+    pdf.setFont('Helvetica', 10)
+    for line in statement['lines']:
+        if y < 60:
+            pdf.showPage()
+            pdf.setFont('Helvetica', 10)
+            y = height - 50
+        values = [line['product'], str(line['bags']), f"K{line['sales']:.2f}", f"K{line['commission']:.2f}"]
+        for x, value in zip(columns, values):
+            pdf.drawString(x, y, value)
+        y -= 15
+
+    y -= 5
+    pdf.setFont('Helvetica-Bold', 10)
+    totals = ['TOTAL', str(statement['total_bags']), f"K{statement['total_sales']:.2f}", f"K{statement['total_commission']:.2f}"]
+    for x, value in zip(columns, totals):
+        pdf.drawString(x, y, value)
+
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+RENDERERS = {
+    'txt': render_statement_text,
+    'csv': render_statement_csv,
+    'pdf': render_statement_pdf,
+}
+
+
+def render_statement(statement, fmt):
+    """Render one statement, returning (filename, content bytes)"""
+    return statement_filename(statement, fmt), RENDERERS[fmt](statement)
+
+
+def _render_job(job):
+    statement, fmt = job
+    return render_statement(statement, fmt)
+
+
+def render_statements(statements, fmt, workers=None):
+    """Render all statements, spreading the work over a process pool.
+
+    Rendering (PDF especially) is CPU bound and the statements are independent,
+    so they are rendered in parallel once there is more than one to do.
+    """
+    if fmt not in RENDERERS:
+        raise ValueError(f"Unknown statement format: {fmt}")
+
+    workers = workers or os.cpu_count() or 1
+    jobs = [(statement, fmt) for statement in statements]
+    if workers <= 1 or len(jobs) <= 1:
+        return [_render_job(job) for job in jobs]
+
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_render_job, jobs, chunksize=chunksize))
@@ -1,3 +1,789 @@
-from django.test import TestCase
+import gzip
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.paginator import Paginator
+from django.db.models import Sum
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import live
+from .allocation import apply_allocation, plan_allocation
+from .backups import (
+    BackupError, create_backup, prune_backups, restore_backup, sha256_file, verify_backup, write_checksum,
+)
+from .depots import get_depot_summary
+from .exports import export_incremental
+from .history import bulk_create_history
+from .integrity import repair, verify_all, verify_partition
+from .models import (
+    DailySale, Depot, ExportWatermark, Product, SalesRollup, SalesRollupPending, SearchDocument, Stock, StockHistory,
+    StockTransfer, UCFPayment,
+)
+from .pricing import reprice_sales
+from .profiling import clear_samples, get_samples, summarize_by_view
+from .reconciliation import Reconciler, parse_statement
+from .rollups import refresh_rollups
+from .routers import STICKY_COOKIE, ReplicaRouter, _use_replica
+from .search import SearchResults
+from .sales import StockAdjustmentError
+from .transfers import TransferError, execute_transfers, parse_transfer_lines
+from .views import get_dashboard_cache_versions
+
+# Tests that cache pages use a private in-memory cache, never the shared one in settings
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'}}
+
+
+def make_depot(name, **kwargs):
+    return Depot.objects.create(name=name, district=name.title(), manager='Manager', phone='0970000000', nrc='000000/00/1', **kwargs)
+
+
+def make_product(name):
+    return Product.objects.create(name=name, price_per_bag=Decimal('1200.00'), commission_per_bag=Decimal('50.00'))
+
+
+def make_stock(depot, product, quantity):
+    return Stock.objects.create(depot=depot, product=product, quantity=Decimal(quantity))
+
+
+class CommissionStatementViewTests(TestCase):
+    def test_invalid_month_is_rejected(self):
+        for month in ('abc', '2026-13', '2026-00', '2026'):
+            for name in ('commission_statements', 'download_commission_statements'):
+                with self.subTest(view=name, month=month):
+                    response = self.client.get(reverse(name), {'month': month})
+                    self.assertEqual(response.status_code, 400)
+
+    def test_valid_month_downloads_zip(self):
+        response = self.client.get(reverse('download_commission_statements'), {'month': '2026-01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+
+
+@override_settings(LIVE_UPDATES_POLL_SECONDS=1, LIVE_UPDATES_HEARTBEAT_SECONDS=1)
+class LiveUpdatesTests(TestCase):
+    def test_wsgi_response_is_a_long_poll(self):
+        broker = live.get_broker()
+        after_id = broker.last_event_id()
+        broker.publish('sales_totals', {'total_overall_sales': 'K0.00'})
+
+        start = time.monotonic()
+        response = self.client.get(reverse('live_updates'), headers={'last-event-id': str(after_id)})
+        body = b''.join(response.streaming_content).decode()
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertIn(f"id: {after_id + 1}\nevent: sales_totals", body)
+
+    def test_repricing_publishes_sales_totals(self):
+        product = make_product('UREA')
+        depot = make_depot('MONZE')
+        make_stock(depot, product, '100')
+        DailySale.objects.create(date=date(2026, 1, 15), depot=depot, product=product, bags_sold=10)
+        product.prices.create(effective_from=date(2026, 1, 1), price_per_bag=Decimal('1300.00'), commission_per_bag=Decimal('50.00'))
+
+        broker = live.get_broker()
+        after_id = broker.last_event_id()
+        with self.captureOnCommitCallbacks(execute=True):
+            reprice_sales(product)
+        totals = [data for _, event_type, data in broker.wait(after_id, 0) if event_type == 'sales_totals']
+        self.assertEqual(totals, [live.sales_totals_event()])
+        self.assertIn('13,000.00', totals[0]['total_overall_sales'])
+
+    def test_idle_long_poll_ends_after_poll_seconds(self):
+        response = self.client.get(reverse('live_updates'))
+        body = b''.join(response.streaming_content).decode()
+        self.assertTrue(body.startswith('retry: 250\n'))
+        self.assertIn(': keep-alive', body)
+
+    @override_settings(LIVE_UPDATES_STREAM_SECONDS=1)
+    async def test_asgi_stream_waits_on_its_own_threads(self):
+        broker = live.get_broker()
+        after_id = broker.last_event_id()
+        broker.publish('sales_totals', {'total_overall_sales': 'K0.00'})
+
+        threads = []
+        original_wait = broker.wait
+
+        def wait(*args):
+            threads.append(threading.current_thread().name)
+            return original_wait(*args)
+
+        with mock.patch.object(broker, 'wait', wait):
+            response = await self.async_client.get(reverse('live_updates'), headers={'last-event-id': str(after_id)})
+            body = ''.join([chunk.decode() async for chunk in response.streaming_content])
+
+        self.assertTrue(threads)
+        self.assertTrue(all(name.startswith('live-stream') for name in threads))
+        self.assertTrue(body.startswith(f"retry: 3000\nid: {after_id}\n\n"))
+        self.assertIn(f"id: {after_id + 1}\nevent: sales_totals", body)
+        self.assertIn(': keep-alive', body)
+
+    def test_cache_broker_needs_atomic_incr(self):
+        with self.assertRaises(ImproperlyConfigured):
+            live.CacheBroker()
+        with override_settings(LIVE_UPDATES_BROKER='fertilizer_tracking.live.CacheBroker'):
+            self.assertEqual([error.id for error in live.check_broker(None)], ['fertilizer_tracking.E001'])
+        self.assertEqual(live.check_broker(None), [])
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.depot = make_depot('MONZE')
+        self.product = make_product('UREA')
+        make_stock(self.depot, self.product, '100')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sale = DailySale.objects.create(date=date(2026, 1, 15), depot=self.depot, product=self.product, bags_sold=40)
+
+    def monthly_bags(self):
+        return dict(SalesRollup.objects.filter(granularity='month').values_list('period_start', 'bags_sold'))
+
+    def test_moving_a_sale_updates_both_months(self):
+        self.assertEqual(self.monthly_bags(), {date(2026, 1, 1): 40})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sale.date = date(2026, 2, 3)
+            self.sale.save()
+
+        self.assertEqual(self.monthly_bags(), {date(2026, 2, 1): 40})
+        self.assertFalse(SalesRollupPending.objects.exists())
+
+    def test_pending_dates_wait_for_the_commit(self):
+        self.sale.bags_sold = 30
+        self.sale.save()
+        self.assertEqual(self.monthly_bags(), {date(2026, 1, 1): 40})
+        # Charts read the rollups as they are and leave the pending dates to the refresh
+        response = self.client.get(reverse('sales_chart_data'), {'start_date': '2026-01-01', 'end_date': '2026-03-31'})
+        self.assertEqual(sum(response.json()['series'][0]['bags']), 40)
+        self.assertTrue(SalesRollupPending.objects.exists())
+
+        call_command('refresh_sales_rollups', stdout=io.StringIO())
+        self.assertEqual(self.monthly_bags(), {date(2026, 1, 1): 30})
+
+    def test_full_refresh_over_existing_rollups(self):
+        refresh_rollups(full=True)
+        self.assertEqual(self.monthly_bags(), {date(2026, 1, 1): 40})
+
+    def test_chart_rejects_bad_parameters(self):
+        url = reverse('sales_chart_data')
+        for params in ({'depot': 'abc'}, {'product': '1.5'}, {'start_date': '2026-13-01'}, {'max_points': 'x'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+
+    def test_chart_filters_by_depot(self):
+        response = self.client.get(reverse('sales_chart_data'), {
+            'start_date': '2026-01-01', 'end_date': '2026-03-31', 'depot': self.depot.pk,
+        })
+        self.assertEqual(response.status_code, 200)
+
+
+class StockTransferTests(TestCase):
+    def setUp(self):
+        self.monze = make_depot('MONZE')
+        self.pemba = make_depot('PEMBA')
+        self.urea = make_product('UREA')
+        self.source = make_stock(self.monze, self.urea, '100')
+
+    def test_transfer_moves_stock_and_records_history(self):
+        lines = parse_transfer_lines('monze, pemba, urea, 12.5, top up\nMONZE, PEMBA, UREA, 7.5')
+        execute_transfers(lines, date(2026, 1, 10), 'planting')
+
+        self.source.refresh_from_db()
+        destination = Stock.objects.get(depot=self.pemba, product=self.urea)
+        self.assertEqual(self.source.quantity, Decimal('80.00'))
+        self.assertEqual(destination.quantity, Decimal('20.00'))
+        self.assertEqual(StockTransfer.objects.count(), 2)
+        self.assertEqual(
+            list(StockHistory.objects.filter(stock=self.source).order_by('id').values_list('new_quantity', flat=True)),
+            [Decimal('87.50'), Decimal('80.00')],
+        )
+
+    def test_insufficient_stock_writes_nothing(self):
+        lines = parse_transfer_lines('MONZE, PEMBA, UREA, 60\nMONZE, PEMBA, UREA, 50')
+        with self.assertRaises(TransferError):
+            execute_transfers(lines, date(2026, 1, 10))
+
+        self.source.refresh_from_db()
+        self.assertEqual(self.source.quantity, Decimal('100.00'))
+        self.assertFalse(StockTransfer.objects.exists())
+        self.assertFalse(StockHistory.objects.exists())
+
+    def test_invalid_quantities_are_line_errors(self):
+        for quantity in ('NaN', 'sNaN', 'Infinity', '-inf', '1e400', 'abc', '0', '-5'):
+            with self.subTest(quantity=quantity):
+                with self.assertRaisesMessage(TransferError, 'Line 1: quantity must be a positive number of MT'):
+                    parse_transfer_lines(f'MONZE, PEMBA, UREA, {quantity}')
+
+    def test_unknown_names_are_reported(self):
+        with self.assertRaisesMessage(TransferError, "Line 1: unknown depot 'KALOMO'"):
+            parse_transfer_lines('KALOMO, PEMBA, UREA, 5')
+
+
+@override_settings(SQL_PROFILER_SAMPLE_RATE=1, CACHES=LOCMEM_CACHES)
+class SQLProfilerTests(TestCase):
+    def setUp(self):
+        clear_samples()
+        cache.clear()
+
+    async def test_async_view_counts_pool_queries(self):
+        await self.async_client.get(reverse('dashboard_async'))
+        [sample] = get_samples()
+        self.assertEqual(sample['view'], 'dashboard_async')
+        self.assertGreater(sample['query_count'], 0)
+
+    def test_summary_keeps_slowest_queries_per_view(self):
+        samples = [
+            {
+                'view': 'dashboard', 'path': '/', 'query_count': 2, 'db_ms': 3.0, 'duplicates': [],
+                'slowest': [
+                    {'sql': f'SELECT * FROM table_{i}', 'ms': float(i)},
+                    {'sql': f'SELECT * FROM stock WHERE id = {i}', 'ms': 6.5},
+                ],
+            }
+            for i in range(1, 8)
+        ]
+        [summary] = summarize_by_view(samples)
+        # The same statement with different literals is listed once
+        self.assertEqual([query['ms'] for query in summary['slowest']], [7.0, 6.5, 6.0, 5.0, 4.0])
+        self.assertEqual(summary['avg_queries'], 2)
+
+
+class AnalyticsExportTests(TestCase):
+    def setUp(self):
+        depot = make_depot('MONZE')
+        self.product = make_product('UREA')
+        make_stock(depot, self.product, '100')
+        self.sale = DailySale.objects.create(date=date(2026, 1, 15), depot=depot, product=self.product, bags_sold=10)
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+
+    def exported_ids(self):
+        import pyarrow.parquet as pq
+        results = export_incremental(self.output_dir, tables=['sales'])
+        return [pq.read_table(path).column('id').to_pylist() for _, path, _ in results]
+
+    def age_sales(self, **delta):
+        DailySale.objects.update(updated_at=timezone.now() - timedelta(**delta))
+
+    def test_edited_sales_are_exported_again(self):
+        self.age_sales(hours=1)
+        self.assertEqual(self.exported_ids(), [[self.sale.pk]])
+        other = DailySale.objects.create(date=date(2026, 1, 16), depot=self.sale.depot, product=self.product, bags_sold=5)
+        # The first sale is inside the overlap this time, and outside it the next
+        self.assertEqual(self.exported_ids(), [[self.sale.pk, other.pk]])
+        self.assertEqual(self.exported_ids(), [[other.pk]])
+
+        self.sale.bags_sold = 12
+        self.sale.save()
+        self.assertEqual(self.exported_ids(), [[other.pk, self.sale.pk]])
+
+    def test_late_commits_inside_the_overlap_are_exported(self):
+        self.assertEqual(self.exported_ids(), [[self.sale.pk]])
+        # A row stamped before the watermark but committed after the last run
+        late = DailySale.objects.create(date=date(2026, 1, 16), depot=self.sale.depot, product=self.product, bags_sold=5)
+        DailySale.objects.filter(pk=late.pk).update(updated_at=ExportWatermark.objects.get(table='sales').last_updated_at - timedelta(seconds=30))
+        self.assertEqual(self.exported_ids(), [[late.pk, self.sale.pk]])
+
+    def test_repriced_sales_are_exported_again(self):
+        self.exported_ids()
+        self.product.prices.create(effective_from=date(2026, 1, 1), price_per_bag=Decimal('1300.00'), commission_per_bag=Decimal('50.00'))
+        reprice_sales(self.product)
+        self.assertEqual(self.exported_ids(), [[self.sale.pk]])
+
+    def test_download_streams_a_temporary_file(self):
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        response = self.client.get(reverse('export_analytics', args=['sales']), {'format': 'arrow'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'ARROW1'))
+
+    def test_download_follows_the_updated_at_watermark(self):
+        import pyarrow.parquet as pq
+
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        url = reverse('export_analytics', args=['sales'])
+        self.age_sales(hours=1)
+        watermark = self.client.get(url)['X-Export-Watermark']
+
+        response = self.client.get(url, {'changed_since': watermark})
+        self.assertEqual(response['X-Export-Watermark'], watermark)
+        self.sale.bags_sold = 12
+        self.sale.save()
+        response = self.client.get(url, {'changed_since': watermark})
+        table = pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.column('id').to_pylist(), [self.sale.pk])
+        self.assertEqual(table.column('bags_sold').to_pylist(), [12])
+        self.assertEqual(self.client.get(url, {'changed_since': 'yesterday'}).status_code, 400)
+
+
+class SaleStockDeltaTests(TestCase):
+    def setUp(self):
+        self.monze = make_depot('MONZE')
+        self.pemba = make_depot('PEMBA')
+        self.urea = make_product('UREA')
+        self.monze_stock = make_stock(self.monze, self.urea, '100')
+        self.pemba_stock = make_stock(self.pemba, self.urea, '8')
+        self.sale = DailySale.objects.create(date=date(2026, 1, 15), depot=self.monze, product=self.urea, bags_sold=200)
+
+    def quantities(self):
+        self.monze_stock.refresh_from_db()
+        self.pemba_stock.refresh_from_db()
+        return self.monze_stock.quantity, self.pemba_stock.quantity
+
+    def sale_bags_by_day(self):
+        return dict(
+            StockHistory.objects.filter(change_type='sale').values('stock__depot__name', 'date')
+            .annotate(bags=Sum('bags_sold')).values_list('stock__depot__name', 'bags')
+        )
+
+    def test_new_sale_takes_stock(self):
+        self.assertEqual(self.quantities(), (Decimal('90.00'), Decimal('8.00')))
+
+    def test_edit_applies_the_difference(self):
+        self.sale.bags_sold = 150
+        self.sale.save()
+        self.assertEqual(self.quantities(), (Decimal('92.50'), Decimal('8.00')))
+        self.assertEqual(self.sale_bags_by_day(), {'MONZE': 150})
+
+    def test_move_to_another_depot(self):
+        self.sale.depot = self.pemba
+        self.sale.bags_sold = 100
+        self.sale.save()
+        self.assertEqual(self.quantities(), (Decimal('100.00'), Decimal('3.00')))
+        self.assertEqual(self.sale_bags_by_day(), {'MONZE': 0, 'PEMBA': 100})
+
+    def test_edit_beyond_stock_is_rolled_back(self):
+        self.sale.depot = self.pemba
+        with self.assertRaises(StockAdjustmentError):
+            self.sale.save()
+        self.sale.refresh_from_db()
+        self.assertEqual(self.sale.depot, self.monze)
+        self.assertEqual(self.quantities(), (Decimal('90.00'), Decimal('8.00')))
+
+    def test_delete_restores_the_saved_bags(self):
+        stale = DailySale.objects.get(pk=self.sale.pk)
+        self.sale.bags_sold = 100
+        self.sale.save()
+
+        stale.delete()
+        self.assertEqual(self.quantities(), (Decimal('100.00'), Decimal('8.00')))
+        self.assertEqual(self.sale_bags_by_day(), {'MONZE': 0})
+
+
+class StockIntegrityTests(TestCase):
+    def setUp(self):
+        depot = make_depot('MONZE')
+        product = make_product('UREA')
+        self.stock = make_stock(depot, product, '100')
+        self.sale = DailySale.objects.create(date=date(2026, 1, 15), depot=depot, product=product, bags_sold=40)
+
+    def add_history(self, previous_quantity, new_quantity, change_type='adjustment'):
+        previous_quantity, new_quantity = Decimal(previous_quantity), Decimal(new_quantity)
+        return StockHistory.objects.create(
+            stock=self.stock, date=date(2026, 1, 16), previous_quantity=previous_quantity, new_quantity=new_quantity,
+            change_type=change_type, quantity_change=new_quantity - previous_quantity,
+        )
+
+    def issues(self):
+        return [(d['check'], d['expected'], d['found']) for d in verify_partition([self.stock.pk])]
+
+    def test_consistent_history_passes(self):
+        self.assertEqual(self.issues(), [])
+        self.assertEqual(verify_all(workers=1), [])
+
+    def test_chain_gap(self):
+        self.add_history('90', '98')
+        self.assertEqual(self.issues(), [('chain_gap', Decimal('98.00'), Decimal('90.00'))])
+
+    def test_chain_end_differs_from_stock(self):
+        Stock.objects.filter(pk=self.stock.pk).update(quantity=Decimal('95'))
+        self.assertEqual(self.issues(), [('chain_end', Decimal('95.00'), Decimal('98.00'))])
+
+    def test_sale_bags_mismatch(self):
+        DailySale.objects.filter(pk=self.sale.pk).update(bags_sold=30)
+        self.assertEqual(self.issues(), [('sale_bags', 30, 40)])
+
+    def test_correction_resets_the_chain(self):
+        self.add_history('90', '98')
+        self.add_history('98', '98', change_type='correction')
+        self.assertEqual(self.issues(), [])
+
+    def test_repair_leaves_nothing_to_report(self):
+        self.add_history('90', '97')
+        issues = verify_all(workers=1)
+        self.assertEqual({d['check'] for d in issues}, {'chain_gap', 'chain_end'})
+
+        corrections = repair(issues)
+        self.assertEqual([(c.previous_quantity, c.new_quantity) for c in corrections], [(Decimal('97.00'), Decimal('98.00'))])
+        self.assertEqual(verify_all(workers=1), [])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.stock = make_stock(make_depot('MONZE'), make_product('UREA'), '100')
+
+    def add_payment(self, description, day=15):
+        return UCFPayment.objects.create(date=date(2026, 1, day), payment_type='payment', amount=Decimal('500.00'), description=description)
+
+    def add_history(self, description):
+        return StockHistory.objects.create(
+            stock=self.stock, date=date(2026, 1, 15), previous_quantity=Decimal('100'), new_quantity=Decimal('100'),
+            change_type='adjustment', quantity_change=Decimal('0'), description=description,
+        )
+
+    def found(self, query, kind=None):
+        return [(result['kind'], result['object'].pk) for result in SearchResults(query, kind=kind)[:25]]
+
+    def test_best_match_comes_first(self):
+        passing = self.add_payment('Deposit mentioning a tarpaulin among many other words for the season', day=20)
+        focused = self.add_payment('Tarpaulin tarpaulin order', day=10)
+        self.assertEqual(self.found('tarpaulin'), [('ucf_payment', focused.pk), ('ucf_payment', passing.pk)])
+        self.assertEqual(self.found('tarp'), self.found('tarpaulin'))
+
+    def test_kind_filter(self):
+        payment = self.add_payment('Lorry hire')
+        history = self.add_history('Lorry delayed at the border')
+        self.assertEqual(self.found('lorry', kind='ucf_payment'), [('ucf_payment', payment.pk)])
+        self.assertEqual(self.found('lorry', kind='stock_history'), [('stock_history', history.pk)])
+        self.assertEqual(len(self.found('lorry')), 2)
+
+    def test_pagination_fetches_one_page(self):
+        for day in range(1, 6):
+            self.add_payment(f'Pallet delivery {day}', day=day)
+        page = Paginator(SearchResults('pallet'), 2).get_page(3)
+        self.assertEqual(page.paginator.count, 5)
+        self.assertEqual([result['object'].date.day for result in page], [1])
+
+    def test_bulk_created_history_is_indexed(self):
+        bulk_create_history([StockHistory(
+            stock=self.stock, date=date(2026, 1, 15), previous_quantity=Decimal('100'), new_quantity=Decimal('90'),
+            change_type='adjustment', description='Flood damage write-off',
+        )])
+        self.assertEqual(len(self.found('flood', kind='stock_history')), 1)
+
+    def test_edits_and_deletes_update_the_index(self):
+        payment = self.add_payment('Lorry hire')
+        payment.description = 'Warehouse rent'
+        payment.save()
+        self.assertEqual(self.found('lorry'), [])
+        self.assertEqual(self.found('warehouse'), [('ucf_payment', payment.pk)])
+
+        payment.delete()
+        self.assertEqual(self.found('warehouse'), [])
+        self.assertFalse(SearchDocument.objects.filter(kind='ucf_payment').exists())
+
+
+@mock.patch('fertilizer_tracking.routers.replica_alias', return_value='replica')
+class ReplicaRoutingTests(TestCase):
+    def read_database(self, model, use_replica):
+        token = _use_replica.set(use_replica)
+        try:
+            return ReplicaRouter().db_for_read(model)
+        finally:
+            _use_replica.reset(token)
+
+    def test_reporting_reads_use_the_replica(self, replica_alias):
+        self.assertEqual(self.read_database(DailySale, True), 'replica')
+        self.assertEqual(self.read_database(DailySale, False), 'default')
+
+    def test_sessions_and_auth_stay_on_the_primary(self, replica_alias):
+        self.assertEqual(self.read_database(Session, True), 'default')
+        self.assertEqual(self.read_database(User, True), 'default')
+
+    def test_writes_set_the_sticky_cookie(self, replica_alias):
+        response = self.client.post(reverse('record_payment'), {
+            'date': '2026-01-15', 'payment_type': 'payment', 'amount': '500.00', 'description': 'Deposit',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.cookies[STICKY_COOKIE]['max-age'], settings.REPLICA_STICKY_SECONDS)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DepotCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.monze = make_depot('MONZE')
+        self.pemba = make_depot('PEMBA')
+        self.urea = make_product('UREA')
+        make_stock(self.monze, self.urea, '100')
+        make_stock(self.pemba, self.urea, '50')
+
+    def test_sale_invalidates_only_its_depot(self):
+        monze_before = get_depot_summary(self.monze)
+        pemba_before = get_depot_summary(self.pemba)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            DailySale.objects.create(date=date.today(), depot=self.monze, product=self.urea, bags_sold=20)
+
+        self.assertEqual(get_depot_summary(self.monze)['sales_totals']['total_bags'], 20)
+        self.assertNotEqual(get_depot_summary(self.monze), monze_before)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_depot_summary(self.pemba), pemba_before)
+
+
+class DeliveryAllocationTests(TestCase):
+    def setUp(self):
+        self.monze = make_depot('MONZE')
+        self.pemba = make_depot('PEMBA', capacity=Decimal('30'))
+        self.kalomo = make_depot('KALOMO')
+        self.urea = make_product('UREA')
+        make_stock(self.monze, self.urea, '50')
+        make_stock(self.pemba, self.urea, '50')
+        # Both depots sold 1 MT a day over the last 30 days, leaving 20 MT each
+        for depot in (self.monze, self.pemba):
+            DailySale.objects.create(date=date.today(), depot=depot, product=self.urea, bags_sold=600)
+
+    def planned(self, lines):
+        return {line['depot'].name: line['quantity'] for line in lines}
+
+    def test_delivery_evens_out_days_of_cover(self):
+        lines, unallocated = plan_allocation({self.urea: Decimal('16')})
+        self.assertEqual(self.planned(lines), {'MONZE': Decimal('8.00'), 'PEMBA': Decimal('8.00')})
+        self.assertEqual(unallocated, {})
+
+    def test_capacity_caps_a_depot(self):
+        # PEMBA holds 20 of its 30 MT, so MONZE takes the rest
+        lines, unallocated = plan_allocation({self.urea: Decimal('100')})
+        self.assertEqual(self.planned(lines), {'MONZE': Decimal('90.00'), 'PEMBA': Decimal('10.00')})
+        self.assertEqual(unallocated, {})
+
+    def test_apply_adds_stock_and_history(self):
+        lines, _ = plan_allocation({self.urea: Decimal('16')})
+        created = apply_allocation(lines, date.today(), 'UCF-001')
+
+        self.assertEqual(len(created), 2)
+        self.assertEqual(
+            dict(Stock.objects.filter(product=self.urea).values_list('depot__name', 'quantity')),
+            {'MONZE': Decimal('28.00'), 'PEMBA': Decimal('28.00')},
+        )
+        self.assertTrue(all(record.description.endswith('(UCF-001)') for record in created))
+
+    def test_command_rejects_invalid_quantities(self):
+        for quantity in ('NaN', 'Infinity', '-5', 'abc'):
+            with self.subTest(quantity=quantity):
+                with self.assertRaisesMessage(CommandError, 'expected a positive number of MT'):
+                    call_command('allocate_delivery', f'UREA={quantity}')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DashboardFragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.depot = make_depot('MONZE')
+        self.product = make_product('UREA')
+        make_stock(self.depot, self.product, '10')
+        self.payment = UCFPayment.objects.create(
+            date=date(2026, 1, 15), payment_type='payment', amount=Decimal('500.00'), description='Deposit',
+        )
+
+    def dashboard(self):
+        return self.client.get(reverse('dashboard')).content.decode()
+
+    def test_edited_payment_is_shown(self):
+        self.assertIn('K500.00', self.dashboard())
+        self.payment.amount = Decimal('750.00')
+        self.payment.save()
+        self.assertIn('K750.00', self.dashboard())
+
+    def test_product_price_change_is_shown(self):
+        self.assertIn('K240,000.00', self.dashboard())
+        self.product.price_per_bag = Decimal('1500.00')
+        self.product.save()
+        self.assertIn('K300,000.00', self.dashboard())
+
+    def test_depot_rename_changes_stock_blocks(self):
+        before = get_dashboard_cache_versions()
+        self.depot.name = 'MONZE EAST'
+        self.depot.save()
+        after = get_dashboard_cache_versions()
+
+        self.assertNotEqual(before['stocks'], after['stocks'])
+        self.assertNotEqual(before['stock_changes'], after['stock_changes'])
+        self.assertEqual(before['payments'], after['payments'])
+        self.assertIn('MONZE EAST', self.dashboard())
+
+    def test_unchanged_dashboard_is_served_from_cache(self):
+        self.dashboard()
+        with self.assertNumQueries(5):
+            self.dashboard()
+
+
+class PrecompressedStaticTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.css = b'body { color: #333; }\n' * 50
+        for name, content in [
+            ('app.css', self.css),
+            ('app.css.gz', gzip.compress(self.css)),
+            ('app.css.br', b'brotli'),
+            ('app.0123456789ab.css', self.css),
+        ]:
+            with open(os.path.join(self.root, name), 'wb') as f:
+                f.write(content)
+
+    def get(self, path, encoding=''):
+        with self.settings(STATIC_ROOT=self.root, STATIC_URL='/static/'):
+            return Client().get(path, headers={'accept-encoding': encoding})
+
+    def test_serves_the_best_accepted_encoding(self):
+        for encoding, expected, body in [
+            ('gzip, deflate, br', 'br', b'brotli'),
+            ('gzip', 'gzip', gzip.compress(self.css)),
+            ('', None, self.css),
+        ]:
+            with self.subTest(encoding=encoding):
+                response = self.get('/static/app.css', encoding)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.get('Content-Encoding'), expected)
+                self.assertEqual(response['Content-Type'], 'text/css')
+                self.assertEqual(response['Vary'], 'Accept-Encoding')
+                self.assertEqual(b''.join(response.streaming_content), body)
+
+    def test_only_hashed_names_are_immutable(self):
+        with mock.patch('fertilizer_tracking.assets.hashed_names', return_value=frozenset({'app.0123456789ab.css'})):
+            hashed = self.get('/static/app.0123456789ab.css')
+            plain = self.get('/static/app.css')
+        self.assertIn('immutable', hashed['Cache-Control'])
+        self.assertEqual(plain['Cache-Control'], 'public, max-age=60')
+
+    def test_missing_and_escaping_paths_are_not_found(self):
+        self.assertEqual(self.get('/static/missing.css').status_code, 404)
+        self.assertEqual(self.get('/static/../outside.css').status_code, 404)
+
+
+class BackupRoundTripTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.directory = os.path.join(self.root, 'backups')
+        self.live = os.path.join(self.root, 'live.sqlite3')
+        self.execute('CREATE TABLE sale (bags INTEGER)', 'INSERT INTO sale VALUES (40)')
+        patcher = mock.patch('fertilizer_tracking.backups._database', return_value=({'NAME': self.live}, 'sqlite'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def execute(self, *statements):
+        conn = sqlite3.connect(self.live)
+        try:
+            with conn:
+                for statement in statements:
+                    conn.execute(statement)
+            return [row[0] for row in conn.execute('SELECT bags FROM sale')]
+        finally:
+            conn.close()
+
+    def test_backup_and_restore(self):
+        path = create_backup(directory=self.directory, sleep=0)
+        with open(path + '.sha256') as f:
+            self.assertEqual(f.read(), f"{sha256_file(path)}  {os.path.basename(path)}\n")
+        verify_backup(path)
+
+        self.assertEqual(self.execute('INSERT INTO sale VALUES (12)'), [40, 12])
+        restore_backup(path, sleep=0)
+        self.assertEqual(self.execute(), [40])
+
+    def test_tampered_backup_is_refused(self):
+        path = create_backup(directory=self.directory, sleep=0)
+        with open(path, 'ab') as f:
+            f.write(b'tampered')
+        self.execute('INSERT INTO sale VALUES (12)')
+
+        with self.assertRaisesMessage(BackupError, 'Checksum mismatch'):
+            verify_backup(path)
+        with self.assertRaisesMessage(BackupError, 'Checksum mismatch'):
+            restore_backup(path, sleep=0)
+        self.assertEqual(self.execute(), [40, 12])
+
+    def test_prune_keeps_the_newest(self):
+        os.makedirs(self.directory)
+        names = [f'default_20260101_00000{second}.sqlite3.gz' for second in range(4)] + ['replica_20260101_000000.sqlite3.gz']
+        for name in names:
+            path = os.path.join(self.directory, name)
+            with open(path, 'wb') as f:
+                f.write(gzip.compress(name.encode()))
+            write_checksum(path)
+
+        removed = prune_backups(2, directory=self.directory)
+        self.assertEqual([os.path.basename(path) for path in removed], [names[1], names[0]])
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(
+            name + suffix for name in names[2:] for suffix in ('', '.sha256')
+        ))
+
+
+class ReconciliationTests(TestCase):
+    payments = [
+        (1, date(2026, 1, 10), Decimal('5000.00'), 'UCF-001', 'payment'),
+        (2, date(2026, 1, 12), Decimal('750.00'), '', 'receipt'),
+        (3, date(2026, 1, 20), Decimal('1200.00'), '', 'payment'),
+        (4, date(2026, 1, 21), Decimal('1200.00'), '', 'payment'),
+        (5, date(2026, 2, 1), Decimal('300.00'), 'UCF-009', 'payment'),
+    ]
+
+    def reconcile(self, csv_text, tolerance_days=3):
+        return Reconciler(self.payments, tolerance_days).reconcile(parse_statement(io.StringIO(csv_text)))
+
+    def statuses(self, result):
+        return {
+            item['line']['line_number']: (status, [payment['id'] for payment in item['payments']])
+            for status, items in [('matched', result.matched), ('ambiguous', result.ambiguous), ('unmatched', result.unmatched)]
+            for item in items
+        }
+
+    def test_matching_rules(self):
+        result = self.reconcile(
+            'Date,Reference,Amount\n'
+            '2026-01-25,ucf 001,"5,000.00"\n'   # reference and amount, whatever the date
+            '14/01/2026,,K750\n'                # amount within the tolerance
+            '2026-01-20,,1200.00\n'             # two payments with this amount nearby
+            '2026-02-01,UCF-009,301.00\n'       # reference matches, amount does not
+            '2026-03-01,,750.00\n'              # amount outside the tolerance
+        )
+        self.assertEqual(self.statuses(result), {
+            2: ('matched', [1]),
+            3: ('matched', [2]),
+            4: ('ambiguous', [3, 4]),
+            5: ('ambiguous', [5]),
+            6: ('unmatched', []),
+        })
+        self.assertEqual([payment['id'] for payment in result.unmatched_payments], [3, 4, 5])
+
+    def test_payment_is_only_matched_once(self):
+        result = self.reconcile('Date,Amount\n2026-01-12,750.00\n2026-01-12,750.00\n')
+        self.assertEqual(self.statuses(result), {2: ('matched', [2]), 3: ('unmatched', [])})
+
+    def test_separate_debit_and_credit_columns(self):
+        result = self.reconcile(
+            'Date,Description,Debit,Credit\n'
+            '2026-01-10,UCF payment,"5,000.00",\n'
+            '2026-01-12,UCF receipt,,750.00\n'
+            '2026-01-13,Bad line,10.00,20.00\n'
+        )
+        self.assertEqual(self.statuses(result), {
+            2: ('matched', [1]), 3: ('matched', [2]), 4: ('unmatched', []),
+        })
+        self.assertEqual(result.unmatched[0]['reason'], 'Could not read date or amount')
+
+    def test_missing_columns_are_reported(self):
+        with self.assertRaisesMessage(ValueError, 'missing required column(s): amount'):
+            self.reconcile('Date,Reference\n2026-01-10,UCF-001\n')
+
+    def test_unreadable_csv_is_a_form_error(self):
+        statement = SimpleUploadedFile('statement.csv', b'Date,Amount\n2026-01-10,' + b'9' * 200000 + b'\n')
+        response = self.client.post(reverse('reconcile_payments'), {'statement': statement, 'tolerance_days': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Could not reconcile statement')
@@ -0,0 +1,138 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .history import lock_stocks, save_stocks
+from .models import Depot, Product, StockHistory, StockTransfer
+
+
+class TransferError(Exception):
+    pass
+
+
+def parse_transfer_lines(text):
+    """Parse transfer lines of the form 'source, destination, product, quantity[, note]'.
+
+    Depots and products are matched by name, case-insensitively. Returns a
+    list of dicts, raising TransferError listing every line that is invalid.
+    """
+    depots = {depot.name.strip().upper(): depot for depot in Depot.objects.all() if depot.name}
+    products = {product.name.strip().upper(): product for product in Product.objects.all() if product.name}
+
+    lines = []
+    errors = []
+    for line_number, raw in enumerate(text.splitlines(), start=1):
+        raw = raw.strip()
+        if not raw or raw.startswith('#'):
+            continue
+        parts = [part.strip() for part in raw.split(',', 4)]
+        if len(parts) < 4:
+            errors.append(f"Line {line_number}: expected 'source, destination, product, quantity'")
+            continue
+
+        source = depots.get(parts[0].upper())
+        destination = depots.get(parts[1].upper())
+        product = products.get(parts[2].upper())
+        try:
+            quantity = Decimal(parts[3])
+            # NaN and Infinity parse as decimals but can't be quantized or compared
+            quantity = quantity.quantize(Decimal('0.01')) if quantity.is_finite() else None
+        except InvalidOperation:
+            quantity = None
+
+        if source is None:
+            errors.append(f"Line {line_number}: unknown depot '{parts[0]}'")
+        if destination is None:
+            errors.append(f"Line {line_number}: unknown depot '{parts[1]}'")
+        if product is None:
+            errors.append(f"Line {line_number}: unknown product '{parts[2]}'")
+        if quantity is None or quantity <= 0:
+            errors.append(f"Line {line_number}: quantity must be a positive number of MT")
+        if source is not None and source == destination:
+            errors.append(f"Line {line_number}: source and destination are the same depot")
+
+        lines.append({
+            'line_number': line_number,
+            'source': source,
+            'destination': destination,
+            'product': product,
+            'quantity': quantity,
+            'note': parts[4] if len(parts) > 4 else '',
+        })
+
+    if errors:
+        raise TransferError('\n'.join(errors))
+    if not lines:
+        raise TransferError('No transfer lines given')
+    return lines
+
+
+def execute_transfers(lines, transfer_date, notes=''):
+    """Apply a batch of transfers in one transaction.
+
+    Every stock row involved is locked up front (in id order, so concurrent
+    batches can't deadlock), the lines are applied against running balances,
+    and the stock updates, transfers and paired history entries are written
+    in bulk. Nothing is written if any source would go below zero.
+    """
+    pairs = set()
+    for line in lines:
+        pairs.add((line['source'].pk, line['product'].pk))
+        pairs.add((line['destination'].pk, line['product'].pk))
+
+    with transaction.atomic():
+        # Destinations without a stock record start from zero
+        stocks = lock_stocks(pairs)
+
+        balances = {key: stock.quantity for key, stock in stocks.items()}
+        for line in lines:
+            source_key = (line['source'].pk, line['product'].pk)
+            if balances[source_key] < line['quantity']:
+                raise TransferError(
+                    f"Line {line['line_number']}: insufficient {line['product'].name} at {line['source'].name}. "
+                    f"Available: {balances[source_key]} MT, trying to transfer: {line['quantity']} MT"
+                )
+            balances[source_key] -= line['quantity']
+            balances[(line['destination'].pk, line['product'].pk)] += line['quantity']
+
+        transfers = StockTransfer.objects.bulk_create([
+            StockTransfer(
+                date=transfer_date,
+                product=line['product'],
+                source_depot=line['source'],
+                destination_depot=line['destination'],
+                quantity=line['quantity'],
+                notes='\n'.join(filter(None, [line['note'], notes])),
+            )
+            for line in lines
+        ])
+
+        running = {key: stock.quantity for key, stock in stocks.items()}
+        history = []
+        for line, stock_transfer in zip(lines, transfers):
+            source_key = (line['source'].pk, line['product'].pk)
+            destination_key = (line['destination'].pk, line['product'].pk)
+            description = (
+                f"Transfer of {line['quantity']} MT {line['product'].name} "
+                f"from {line['source'].name} to {line['destination'].name}"
+            )
+            for key, change, change_type in [
+                (source_key, -line['quantity'], 'transfer_out'),
+                (destination_key, line['quantity'], 'transfer_in'),
+            ]:
+                history.append(StockHistory(
+                    stock=stocks[key],
+                    transfer=stock_transfer,
+                    date=transfer_date,
+                    previous_quantity=running[key],
+                    new_quantity=running[key] + change,
+                    change_type=change_type,
+                    description=description,
+                ))
+                running[key] += change
+
+        for key, stock in stocks.items():
+            stock.quantity = balances[key]
+        save_stocks(stocks.values(), history)
+
+    return transfers
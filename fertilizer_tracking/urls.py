@@ -1,14 +1,28 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
     path('record-sale/', views.record_sale, name='record_sale'),
     path('record-payment/', views.record_payment, name='record_payment'),
     path('update-stock/<int:stock_id>/', views.update_stock, name='update_stock'),
+    path('transfer-stock/', views.transfer_stock, name='transfer_stock'),
+    path('depots/', views.depot_list, name='depot_list'),
+    path('depots/<int:depot_id>/', views.depot_dashboard, name='depot_dashboard'),
+    path('depots/<int:depot_id>/sales-report/', views.depot_sales_report, name='depot_sales_report'),
     path('stock-history/', views.stock_history, name='stock_history'),
     path('stock-history/<int:stock_id>/', views.stock_history, name='stock_history_detail'),
     path('sales-report/', views.sales_report, name='sales_report'),
     path('download-sales-report/', views.download_sales_report, name='download_sales_report'),
     path('ucf-balance/', views.ucf_balance_report, name='ucf_balance'),
+    path('commission-statements/', views.commission_statements, name='commission_statements'),
+    path('download-commission-statements/', views.download_commission_statements, name='download_commission_statements'),
+    path('search/', views.search, name='search'),
+    path('reconcile-payments/', views.reconcile_payments, name='reconcile_payments'),
+    path('async/', async_views.dashboard, name='dashboard_async'),
+    path('async/ucf-balance/', async_views.ucf_balance_report, name='ucf_balance_async'),
+    path('live/', views.live_updates, name='live_updates'),
+    path('api/sales-chart/', views.sales_chart_data, name='sales_chart_data'),
+    path('sql-profile/', views.sql_profile, name='sql_profile'),
+    path('export/<str:table>/', views.export_analytics, name='export_analytics'),
 ]
\ No newline at end of file
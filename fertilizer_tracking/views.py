@@ -1,24 +1,47 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse
-from django.db.models import Sum, Q
+from django.urls import reverse
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Max, Sum, Q
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import SimpleLazyObject
 from datetime import date, timedelta
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.conf import settings
+from asgiref.sync import sync_to_async
 from decimal import Decimal
-
-from .models import Depot, Product, Stock, DailySale, UCFPayment, DailyBalance, StockHistory
-from .forms import DailySaleForm, UCFPaymentForm, StockUpdateForm
-
-def dashboard(request):
-    today = date.today()
-
-    # Overall sales (all time)
-    all_sales = DailySale.objects.all()
-    total_overall_sales = all_sales.aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-    total_overall_commissions = all_sales.aggregate(Sum('commission_earned'))['commission_earned__sum'] or 0
-
-    # Current stock with monetary value
-    stocks = Stock.objects.select_related('depot', 'product')
+import csv
+import io
+import tempfile
+import time
+import zipfile
+
+from .models import Depot, Product, ProductPrice, Stock, DailySale, UCFPayment, DailyBalance, StockHistory, SearchDocument, StockTransfer
+from . import live
+from .depots import get_depot_sales, get_depot_summary, user_depots
+from .exports import EXPORT_FORMATS, EXPORT_TABLES, export_table, overlap_start
+from .forms import DailySaleForm, UCFPaymentForm, StockUpdateForm, StatementUploadForm, StockTransferForm
+from .profiling import clear_samples, get_samples, summarize_by_view
+from .reconciliation import reconcile_statement
+from .rollups import sales_chart
+from .search import SearchResults
+from .transfers import TransferError, execute_transfers
+from .statements import (
+    STATEMENT_FORMATS, build_commission_statements, parse_month, render_statement, render_statements,
+)
+
+def get_sales_totals():
+    """Overall sales and commission totals (all time)"""
+    totals = DailySale.objects.aggregate(Sum('total_amount'), Sum('commission_earned'))
+    return totals['total_amount__sum'] or 0, totals['commission_earned__sum'] or 0
+
+def get_stock_summary():
+    """Current stock rows with their total monetary value and available bags"""
+    stocks = list(Stock.objects.select_related('depot', 'product').prefetch_related('product__prices'))
 
     # Calculate total stock value and total available bags
     total_stock_value = 0
@@ -27,24 +50,64 @@ def dashboard(request):
         total_stock_value += stock.get_monetary_value()
         total_available_bags += stock.get_available_bags()
 
-    # Payments to UCF
-    recent_payments = UCFPayment.objects.order_by('-date')[:5]
+    return stocks, total_stock_value, total_available_bags
+
+def get_recent_payments(limit=5):
+    return list(UCFPayment.objects.order_by('-date')[:limit])
+
+def get_recent_stock_changes(limit=10):
+    return list(StockHistory.objects.select_related('stock', 'stock__depot', 'stock__product').order_by('-date', '-created_at')[:limit])
+
+def get_dashboard_cache_versions():
+    """Fingerprints of the data behind each cached dashboard block.
+
+    A block's cache key changes whenever a row it shows is added, removed or
+    updated, so stale fragments are simply never looked up again.
+    """
+    # Both blocks show depot and product names, and the stock table the product's base price
+    stock = Stock.objects.aggregate(
+        updated=Max('date_updated'), count=Count('id'),
+        depots=Max('depot__updated_at'), products=Max('product__updated_at'),
+    )
+    prices = ProductPrice.objects.aggregate(created=Max('created_at'), count=Count('id'))
+    payments = UCFPayment.objects.aggregate(last=Max('id'), count=Count('id'), updated=Max('updated_at'))
+    history = StockHistory.objects.aggregate(last=Max('id'), count=Count('id'), updated=Max('updated_at'))
+    names = f"{stock['depots']}-{stock['products']}"
+    # Stock values use today's price, so the stock blocks also change with the date
+    return {
+        'stocks': f"{stock['updated']}-{stock['count']}-{names}-{prices['created']}-{prices['count']}-{date.today()}",
+        'payments': f"{payments['last']}-{payments['count']}-{payments['updated']}",
+        'stock_changes': f"{history['last']}-{history['count']}-{history['updated']}-{names}",
+    }
 
-    # Recent stock changes
-    recent_stock_changes = StockHistory.objects.select_related('stock', 'stock__depot', 'stock__product').order_by('-date', '-created_at')[:10]
+def build_dashboard_context(sales_totals, stock_summary, recent_payments, recent_stock_changes, cache_versions):
+    total_overall_sales, total_overall_commissions = sales_totals
 
-    context = {
-        'all_sales': all_sales,
+    # Accessed through callables so that a lazy stock summary is only computed
+    # when the template renders a block that isn't in the fragment cache
+    return {
+        'all_sales': DailySale.objects.all(),
         'total_overall_sales': total_overall_sales,
         'total_overall_commissions': total_overall_commissions,
-        'stocks': stocks,
+        'stocks': lambda: stock_summary[0],
         'recent_payments': recent_payments,
         'recent_stock_changes': recent_stock_changes,
-        'total_stock_value': total_stock_value,
-        'total_available_bags': total_available_bags,
-        'today': today,
+        'total_stock_value': lambda: stock_summary[1],
+        'total_available_bags': lambda: stock_summary[2],
+        'cache_versions': cache_versions,
+        'cache_timeout': getattr(settings, 'DASHBOARD_CACHE_SECONDS', 300),
+        'today': date.today(),
     }
 
+def dashboard(request):
+    context = build_dashboard_context(
+        get_sales_totals(),
+        SimpleLazyObject(get_stock_summary),
+        SimpleLazyObject(get_recent_payments),
+        SimpleLazyObject(get_recent_stock_changes),
+        get_dashboard_cache_versions(),
+    )
+
     return render(request, 'fertilizer_tracking/dashboard.html', context)
 
 def record_sale(request):
@@ -237,17 +300,24 @@ def download_sales_report(request):
     response.write("\n".join(report_lines))
     return response
 
-def ucf_balance_report(request):
-    # Calculate total owed to UCF
+def get_ucf_totals():
+    """Total sales, payments to UCF and receipts from UCF"""
     total_sales = DailySale.objects.aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-    total_payments = UCFPayment.objects.filter(payment_type='payment').aggregate(Sum('amount'))['amount__sum'] or 0
-    total_receipts = UCFPayment.objects.filter(payment_type='receipt').aggregate(Sum('amount'))['amount__sum'] or 0
+    payment_totals = UCFPayment.objects.aggregate(
+        total_payments=Sum('amount', filter=Q(payment_type='payment')),
+        total_receipts=Sum('amount', filter=Q(payment_type='receipt')),
+    )
+    return total_sales, payment_totals['total_payments'] or 0, payment_totals['total_receipts'] or 0
 
-    balance_owed = total_sales - total_payments + total_receipts
+def get_all_payments():
+    return list(UCFPayment.objects.all().order_by('-date'))
 
-    payments = UCFPayment.objects.all().order_by('-date')
+def build_ucf_balance_context(ucf_totals, payments):
+    # Calculate total owed to UCF
+    total_sales, total_payments, total_receipts = ucf_totals
+    balance_owed = total_sales - total_payments + total_receipts
 
-    context = {
+    return {
         'total_sales': total_sales,
         'total_payments': total_payments,
         'total_receipts': total_receipts,
@@ -255,4 +325,277 @@ def ucf_balance_report(request):
         'payments': payments,
     }
 
-    return render(request, 'fertilizer_tracking/ucf_balance.html', context)
\ No newline at end of file
+def ucf_balance_report(request):
+    context = build_ucf_balance_context(get_ucf_totals(), get_all_payments())
+
+    return render(request, 'fertilizer_tracking/ucf_balance.html', context)
+
+def commission_statements(request):
+    """Per-depot commission summary for a month"""
+    try:
+        year, month = parse_month(request.GET.get('month'))
+        statements = build_commission_statements(year, month)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid month, expected YYYY-MM')
+
+    context = {
+        'statements': statements,
+        'month': f"{year}-{month:02d}",
+        'total_bags': sum(s['total_bags'] for s in statements),
+        'total_sales': sum(s['total_sales'] for s in statements),
+        'total_commission': sum(s['total_commission'] for s in statements),
+        'formats': STATEMENT_FORMATS,
+    }
+
+    return render(request, 'fertilizer_tracking/commission_statements.html', context)
+
+def download_commission_statements(request):
+    """Download one depot's statement, or a zip of every depot's statement"""
+    try:
+        year, month = parse_month(request.GET.get('month'))
+        statements = build_commission_statements(year, month)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid month, expected YYYY-MM')
+    fmt = request.GET.get('format', 'txt')
+    if fmt not in STATEMENT_FORMATS:
+        fmt = 'txt'
+    depot_id = request.GET.get('depot')
+
+    content_types = {'txt': 'text/plain', 'csv': 'text/csv', 'pdf': 'application/pdf'}
+
+    if depot_id:
+        statement = next((s for s in statements if str(s['depot_id']) == depot_id), None)
+        if statement is None:
+            messages.error(request, "No sales recorded for that depot in the selected month.")
+            return redirect(f"{reverse('commission_statements')}?month={year}-{month:02d}")
+        filename, content = render_statement(statement, fmt)
+        response = HttpResponse(content, content_type=content_types[fmt])
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        # Render in the request thread; worker processes are for the management command
+        for filename, content in render_statements(statements, fmt, workers=1):
+            archive.writestr(filename, content)
+
+    response = HttpResponse(buffer.getvalue(), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="commission_statements_{year}_{month:02d}_{fmt}.zip"'
+    return response
+
+def search(request):
+    """Ranked full-text search over stock history and UCF payments"""
+    query = request.GET.get('q', '').strip()
+    kind = request.GET.get('kind', '')
+
+    results = SearchResults(query, kind=kind)
+    page = Paginator(results, 25).get_page(request.GET.get('page'))
+
+    context = {
+        'query': query,
+        'kind': kind,
+        'kinds': SearchDocument.KINDS,
+        'page': page,
+    }
+
+    return render(request, 'fertilizer_tracking/search.html', context)
+
+def reconcile_payments(request):
+    """Upload a UCF/bank statement and match it against recorded payments"""
+    result = None
+
+    if request.method == 'POST':
+        form = StatementUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            stream = io.TextIOWrapper(form.cleaned_data['statement'].file, encoding='utf-8-sig', newline='')
+            try:
+                result = reconcile_statement(stream, tolerance_days=form.cleaned_data['tolerance_days'])
+            except (ValueError, csv.Error) as e:
+                messages.error(request, f"Could not reconcile statement: {e}")
+    else:
+        form = StatementUploadForm()
+
+    return render(request, 'fertilizer_tracking/reconcile_payments.html', {'form': form, 'result': result})
+
+def event_stream(broker, stream):
+    yield stream.preamble()
+    while (timeout := stream.next_timeout()) is not None:
+        yield stream.frames(broker.wait(stream.after_id, timeout))
+
+async def async_event_stream(broker, stream):
+    # Under ASGI a sync generator would be buffered whole, so wait off the event loop instead
+    wait = sync_to_async(broker.wait, thread_sensitive=False, executor=live.stream_executor)
+    yield stream.preamble()
+    while (timeout := stream.next_timeout()) is not None:
+        yield stream.frames(await wait(stream.after_id, timeout))
+
+def live_updates(request):
+    """Server-sent events stream of stock, sales and payment changes for the dashboard.
+
+    Long-lived streams need ASGI. Under WSGI every open stream holds a worker
+    thread, so the response is a short long poll instead: it ends after the
+    first events or LIVE_UPDATES_POLL_SECONDS, and EventSource reconnects with
+    Last-Event-ID.
+    """
+    broker = live.get_broker()
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    after_id = int(last_event_id) if last_event_id.isdigit() else broker.last_event_id()
+
+    # Streams are closed periodically and the browser reconnects with Last-Event-ID
+    lifetime = getattr(settings, 'LIVE_UPDATES_STREAM_SECONDS', 300)
+    heartbeat = getattr(settings, 'LIVE_UPDATES_HEARTBEAT_SECONDS', 15)
+
+    if isinstance(request, ASGIRequest):
+        stream = async_event_stream(broker, live.EventStream(after_id, lifetime, heartbeat))
+    else:
+        lifetime = min(lifetime, getattr(settings, 'LIVE_UPDATES_POLL_SECONDS', 25))
+        stream = event_stream(broker, live.EventStream(after_id, lifetime, heartbeat, long_poll=True))
+
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def sales_chart_data(request):
+    """JSON series of bags and revenue for trend charts, served from the sales rollups"""
+    try:
+        end_date = date.fromisoformat(request.GET.get('end_date') or date.today().isoformat())
+        start_date = date.fromisoformat(request.GET.get('start_date') or (end_date - timedelta(days=365)).isoformat())
+        max_points = min(int(request.GET.get('max_points', 60)), 500)
+        depot_id = int(request.GET['depot']) if request.GET.get('depot') else None
+        product_id = int(request.GET['product']) if request.GET.get('product') else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid start_date, end_date, max_points, depot or product'}, status=400)
+    if start_date > end_date or max_points < 1:
+        return JsonResponse({'error': 'start_date must not be after end_date and max_points must be positive'}, status=400)
+
+    data = sales_chart(
+        start_date,
+        end_date,
+        group_by=request.GET.get('group_by'),
+        depot_id=depot_id,
+        product_id=product_id,
+        max_points=max_points,
+    )
+    return JsonResponse(data)
+
+@login_required
+def depot_list(request):
+    """The depots the user can view; managers of a single depot go straight to it"""
+    depots = list(user_depots(request.user))
+    if len(depots) == 1 and not request.user.is_staff:
+        return redirect('depot_dashboard', depot_id=depots[0].pk)
+    return render(request, 'fertilizer_tracking/depot_list.html', {'depots': depots})
+
+@login_required
+def depot_dashboard(request, depot_id):
+    depot = get_object_or_404(user_depots(request.user), pk=depot_id)
+    context = dict(get_depot_summary(depot), depot=depot, today=date.today())
+    return render(request, 'fertilizer_tracking/depot_dashboard.html', context)
+
+@login_required
+def depot_sales_report(request, depot_id):
+    depot = get_object_or_404(user_depots(request.user), pk=depot_id)
+    start_date = request.GET.get('start_date', date.today() - timedelta(days=30))
+    end_date = request.GET.get('end_date', date.today())
+
+    if isinstance(start_date, str):
+        start_date = date.fromisoformat(start_date)
+    if isinstance(end_date, str):
+        end_date = date.fromisoformat(end_date)
+
+    context = dict(get_depot_sales(depot, start_date, end_date), depot=depot, start_date=start_date, end_date=end_date)
+    return render(request, 'fertilizer_tracking/depot_sales_report.html', context)
+
+def transfer_stock(request):
+    """Move stock between depots, one or many transfer lines at a time"""
+    if request.method == 'POST':
+        form = StockTransferForm(request.POST)
+        if form.is_valid():
+            try:
+                transfers = execute_transfers(
+                    form.cleaned_data['lines'],
+                    form.cleaned_data['date'],
+                    form.cleaned_data['notes'],
+                )
+                messages.success(request, f"Recorded {len(transfers)} stock transfer{'s' if len(transfers) != 1 else ''}.")
+                return redirect('transfer_stock')
+            except TransferError as e:
+                messages.error(request, str(e))
+        else:
+            messages.error(request, "Please correct the errors below.")
+    else:
+        form = StockTransferForm(initial={'date': date.today()})
+
+    recent_transfers = StockTransfer.objects.select_related('product', 'source_depot', 'destination_depot')[:20]
+
+    return render(request, 'fertilizer_tracking/transfer_stock.html', {
+        'form': form,
+        'stocks': Stock.objects.select_related('depot', 'product').order_by('depot__name', 'product__name'),
+        'recent_transfers': recent_transfers,
+    })
+
+@staff_member_required
+def sql_profile(request):
+    """Admin-only view of the SQL profiler's sampled requests"""
+    if request.method == 'POST' and 'clear' in request.POST:
+        clear_samples()
+        messages.success(request, "Profiler samples cleared.")
+        return redirect('sql_profile')
+
+    samples = get_samples()
+    if request.GET.get('format') == 'json':
+        response = JsonResponse({'samples': samples, 'views': summarize_by_view(samples)})
+        response['Content-Disposition'] = 'attachment; filename="sql_profile.json"'
+        return response
+
+    context = {
+        'sample_rate': getattr(settings, 'SQL_PROFILER_SAMPLE_RATE', 0.0),
+        'views': summarize_by_view(samples),
+        'samples': list(reversed(samples))[:50],
+        'sample_count': len(samples),
+    }
+
+    return render(request, 'fertilizer_tracking/sql_profile.html', context)
+
+@staff_member_required
+def export_analytics(request, table):
+    """Download a table as Parquet or Arrow IPC, optionally only rows changed since a watermark.
+
+    The X-Export-Watermark response header is the latest change in the file;
+    pass it back as ?changed_since= to fetch the next batch. Like the export
+    command, the window reaches EXPORT_OVERLAP_SECONDS before the watermark,
+    so some rows arrive twice and should be deduplicated by id.
+    """
+    if table not in EXPORT_TABLES:
+        raise Http404("Unknown export table")
+    fmt = request.GET.get('format', 'parquet')
+    if fmt not in EXPORT_FORMATS:
+        fmt = 'parquet'
+    changed_since = None
+    if request.GET.get('changed_since'):
+        try:
+            changed_since = parse_datetime(request.GET['changed_since'])
+        except ValueError:
+            changed_since = None
+        if changed_since is None:
+            return HttpResponseBadRequest('Invalid changed_since, expected an ISO 8601 date and time')
+        if timezone.is_naive(changed_since):
+            changed_since = timezone.make_aware(changed_since)
+
+    # Write to a temporary file and stream it back, so the export never sits in memory;
+    # the file is removed when FileResponse closes it
+    export_file = tempfile.TemporaryFile(suffix=f'.{fmt}')
+    try:
+        _, _, last_updated_at = export_table(table, export_file, fmt=fmt, changed_since=overlap_start(changed_since))
+    except ImportError:
+        export_file.close()
+        return HttpResponse('Analytics exports require pyarrow to be installed', status=501)
+    export_file.seek(0)
+
+    stamp = changed_since.strftime('%Y%m%dT%H%M%S') if changed_since else 'start'
+    response = FileResponse(export_file, as_attachment=True, filename=f"{table}_changed_since_{stamp}.{fmt}")
+    watermark = last_updated_at or changed_since
+    if watermark:
+        response['X-Export-Watermark'] = watermark.isoformat()
+    return response